@@ -2,8 +2,344 @@
 This file contains all functions related to the Ad-Hoc Broadcast Protocol.
 Note that since it does not inherit from the Node Class, the considered node
 is always passed as an argument -> calling_node
+The BRG-sets are computed on a LocalTwoHop structure of the calling_node
+with bitmasks instead of a networkx graph; build_BRG_graph is the original
+graph based version.
 """
+import multiprocessing
 import networkx as nx
+from collections import OrderedDict
+
+
+class LocalTwoHop(object):
+    """
+    Two-hop neighborhood of a node in local indices, only containing node IDs
+
+    class attributes:
+    cache_size -- max number of BRG-sets remembered per node
+    """
+    cache_size = 256
+
+    def __init__(self, calling_node):
+        """
+        Build the local structure out of the two_hop_dict of calling_node
+
+        The 1-hop neighbors are ordered like graph.neighbors(calling_node) in the
+        graph of build_2_hop_graph, so ties are broken the same way.
+        The 2-hop neighbors are numbered and every 1-hop neighbor gets a bitmask
+        with the 2-hop neighbors it is connected to.
+        Note that there are no edges between 1-hop neighbors, since the 2-hop
+        lists do not contain 1-hop neighbors -> remove_edges has nothing to do.
+
+        Instance attributes:
+        center -- ID of calling_node
+        one_hop -- list with the IDs of the 1-hop neighbors
+        two_hop -- list with the IDs of the 2-hop neighbors
+        masks -- list with the 2-hop bitmask of each 1-hop neighbor
+        one_hop_index -- dict ID -> position in one_hop
+        two_hop_index -- dict ID -> bit in the 2-hop bitmasks
+        cache -- OrderedDict with the pruning context as key and BRG-set as value
+        table -- precomputed BRG-sets, see precompute_relay_tables
+        hits, misses -- counters of the cache and table lookups
+        shared -- messages which reused the BRG-set of another message
+                  of the same batch, see build_BRG_batch
+        """
+        # same insertion as the adjacency dict of calling_node in the BRG graph
+        order = {}
+        for node in calling_node.two_hop_dict:
+            order[node] = None
+        self.center = calling_node.ID
+        self.one_hop = []
+        self.two_hop = []
+        self.masks = []
+        self.one_hop_index = {}
+        self.two_hop_index = {}
+        for node in order:
+            self.one_hop_index[node.ID] = len(self.one_hop)
+            self.one_hop.append(node.ID)
+            mask = 0
+            for neigh in calling_node.two_hop_dict[node]:
+                if neigh.ID not in self.two_hop_index:
+                    self.two_hop_index[neigh.ID] = len(self.two_hop)
+                    self.two_hop.append(neigh.ID)
+                mask |= 1 << self.two_hop_index[neigh.ID]
+            self.masks.append(mask)
+        self.cache = OrderedDict()
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def path_masks(self, path_set, last_id=None):
+        """
+        Return the bitmasks of the local nodes which are on the path
+
+        Either the local nodes are checked against the path_set or the
+        path IDs against the local index, whichever is shorter.
+        So the time is at most linear in the size of the neighborhood.
+
+        Arguments:
+        path_set -- set with the path IDs of the message (node.ID + 1)
+        last_id -- ID of the last path node; it does not count as path node
+
+        Return-type:
+        one_mask -- bit i set if one_hop[i] is on the path
+        two_mask -- bit j set if two_hop[j] is on the path
+        """
+        one_mask = 0
+        two_mask = 0
+        if len(path_set) < len(self.one_hop) + len(self.two_hop):
+            for path_id in path_set:
+                node_id = path_id - 1
+                if node_id == last_id:
+                    continue
+                if node_id in self.one_hop_index:
+                    one_mask |= 1 << self.one_hop_index[node_id]
+                elif node_id in self.two_hop_index:
+                    two_mask |= 1 << self.two_hop_index[node_id]
+            return one_mask, two_mask
+        for i, node_id in enumerate(self.one_hop):
+            if node_id + 1 in path_set and node_id != last_id:
+                one_mask |= 1 << i
+        for j, node_id in enumerate(self.two_hop):
+            if node_id + 1 in path_set and node_id != last_id:
+                two_mask |= 1 << j
+        return one_mask, two_mask
+
+    def compute_brg(self, one_path, two_path, last_id=None):
+        """
+        Compute the BRG-set for the given path nodes
+
+        Same greedy selection as build_BRG_graph:
+        delete path nodes and their neighbors, then as long as nodes remain
+        delete isolated nodes and 1-hop neighbors with degree 1 and add
+        the 1-hop neighbor with the highest degree to the BRG-set.
+
+        Arguments:
+        one_path, two_path -- bitmasks of the path nodes, see path_masks
+        last_id -- ID of the last path node, it is not deleted as a neighbor
+
+        Return-type:
+        brg -- list with the IDs of the BRG-set
+        """
+        size = len(self.one_hop)
+        alive_one = (1 << size) - 1
+        alive_two = (1 << len(self.two_hop)) - 1
+        keep_one = 0
+        keep_two = 0
+        if last_id in self.one_hop_index:
+            keep_one = 1 << self.one_hop_index[last_id]
+        elif last_id in self.two_hop_index:
+            keep_two = 1 << self.two_hop_index[last_id]
+        # path nodes and their neighbors; the center is never deleted
+        del_one = 0
+        del_two = 0
+        for i in range(size):
+            if one_path >> i & 1:
+                del_two |= self.masks[i]
+            elif self.masks[i] & two_path:
+                del_one |= 1 << i
+        alive_one &= ~(one_path | (del_one & ~keep_one))
+        alive_two &= ~(two_path | (del_two & ~keep_two))
+        center = True
+        brg = []
+        while center or alive_one or alive_two:
+            # remove isolated nodes and 1-hop neighbors with degree = 1
+            covered = 0
+            lonely = 0
+            for i in range(size):
+                if alive_one >> i & 1:
+                    covered |= self.masks[i]
+                    if not self.masks[i] & alive_two:
+                        lonely |= 1 << i
+            center_isolated = center and not alive_one
+            alive_two &= covered
+            if center:
+                alive_one &= ~lonely
+            center = center and not center_isolated
+            if not (center or alive_one or alive_two):
+                break
+            # add the 1-hop neighbor with the highest degree
+            added = -1
+            added_degree = -1
+            for i in range(size):
+                if alive_one >> i & 1:
+                    degree = bin(self.masks[i] & alive_two).count('1')
+                    if degree > added_degree:
+                        added = i
+                        added_degree = degree
+            if added < 0:
+                continue
+            brg.append(self.one_hop[added])
+            alive_one &= ~(1 << added)
+            alive_two &= ~self.masks[added]
+        return brg
+
+    def brg(self, path_set, last_id=None):
+        """
+        Return the BRG-set for a message path, use the cache if possible
+
+        The BRG-set only depends on which local nodes are on the path,
+        thus the path bitmasks are the key of the cache. The cache is
+        bounded by cache_size and drops the least recently used entry.
+        Since the structure is rebuilt when the neighborhood changes,
+        the cache never holds BRG-sets of an old topology.
+
+        Arguments:
+        path_set -- set with the path IDs of the message (node.ID + 1)
+        last_id -- ID of the last path node
+
+        Return-type:
+        brg -- list with the IDs of the BRG-set
+        """
+        one_path, two_path = self.path_masks(path_set, last_id)
+        return self.lookup(self.context(one_path, two_path, last_id))
+
+    def context(self, one_path, two_path, last_id):
+        """Return the cache key of a pruning context"""
+        if last_id not in self.one_hop_index and last_id not in self.two_hop_index:
+            last_id = None
+        return one_path, two_path, last_id
+
+    def lookup(self, key):
+        """Return the BRG-set of a cache key, compute it on a miss"""
+        if key in self.table:
+            self.hits += 1
+            return list(self.table[key])
+        if key in self.cache:
+            self.hits += 1
+            brg = self.cache.pop(key)
+        else:
+            self.misses += 1
+            brg = self.compute_brg(*key)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[key] = brg
+        return list(brg)
+
+
+    def path_contexts(self, adjacency, depth):
+        """
+        Enumerate the pruning contexts of the paths arriving at the node
+
+        Walk all simple paths of up to depth nodes backwards from the center
+        through the real topology. The own message has no path nodes.
+
+        Arguments:
+        adjacency -- dict with node ID as key and list of neighbor IDs as value
+        depth -- max number of path nodes before the center
+
+        Return-type:
+        contexts -- set of cache keys
+        """
+        contexts = set([self.context(0, 0, None)])
+        stack = [[self.center]]
+        while stack:
+            path = stack.pop()
+            if len(path) > 1:
+                path_set = set(node_id + 1 for node_id in path)
+                contexts.add(self.context(*(self.path_masks(path_set, self.center) +
+                                            (self.center,))))
+            if len(path) <= depth:
+                for neigh in adjacency[path[-1]]:
+                    if neigh not in path:
+                        stack.append(path + [neigh])
+        return contexts
+
+
+# topology of the relay table workers, set by init_relay_worker
+RELAY_ADJACENCY = {}
+
+
+def init_relay_worker(adjacency):
+    """Store the topology in a worker process of precompute_relay_tables"""
+    global RELAY_ADJACENCY
+    RELAY_ADJACENCY = adjacency
+
+
+def relay_table(task):
+    """
+    Compute the BRG-sets of all path contexts of one node
+
+    Top-level function, such that it can be sent to the worker processes.
+
+    Arguments:
+    task -- tuple (LocalTwoHop, depth)
+
+    Return-type:
+    center -- ID of the node
+    table -- dict with the cache key as key and the BRG-set as value
+    """
+    local, depth = task
+    table = {}
+    for key in local.path_contexts(RELAY_ADJACENCY, depth):
+        table[key] = local.compute_brg(*key)
+    return local.center, table
+
+
+def precompute_relay_tables(graph, depth=2, processes=None):
+    """
+    Precompute the BRG-sets of every node before the broadcast starts
+
+    For every node and every path of up to depth nodes arriving at it
+    (e.g. depth = 2: all pairs of arriving-from neighbor and its predecessor)
+    compute the BRG-set in a process pool and store it in the table of the
+    LocalTwoHop. During the rounds the BRG-sets are then only looked up;
+    longer path contexts which are not in the table are computed as before.
+    The two_hop_dict of all nodes has to be built already.
+
+    Arguments:
+    graph -- networkx.Graph with Node instances
+    depth -- max number of path nodes of the precomputed contexts
+    processes -- size of the process pool; 1 -> no pool (default = number of cpus)
+
+    Return-type:
+    None
+    """
+    adjacency = dict((node.ID, [neigh.ID for neigh in graph.neighbors(node)])
+                     for node in graph.nodes())
+    nodes = dict((node.ID, node) for node in graph.nodes())
+    tasks = [(get_local_two_hop(node), depth) for node in graph.nodes()]
+    if processes == 1:
+        init_relay_worker(adjacency)
+        results = [relay_table(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes, init_relay_worker, (adjacency,))
+        try:
+            chunk = max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count())))
+            results = pool.map(relay_table, tasks, chunk)
+        finally:
+            pool.close()
+            pool.join()
+    for center, table in results:
+        nodes[center].local_two_hop.table = table
+
+
+def brg_cache_stats(graph):
+    """
+    Sum up the BRG cache counters of all nodes in the graph
+
+    Return-type:
+    hits -- number of BRG-sets taken from the caches
+    misses -- number of computed BRG-sets
+    shared -- number of BRG-sets reused inside a batch without a lookup
+    """
+    hits = 0
+    misses = 0
+    shared = 0
+    for node in graph.nodes():
+        if node.local_two_hop is not None:
+            hits += node.local_two_hop.hits
+            misses += node.local_two_hop.misses
+            shared += node.local_two_hop.shared
+    return hits, misses, shared
+
+
+def get_local_two_hop(calling_node):
+    """Return the LocalTwoHop of calling_node, build it if necessary"""
+    if calling_node.local_two_hop is None:
+        calling_node.local_two_hop = LocalTwoHop(calling_node)
+    return calling_node.local_two_hop
 
 
 def del_brg(message):
@@ -37,9 +373,9 @@ def build_2_hop_graph(calling_node):
     return my_graph
 
 
-def check_path_node(calling_node, del_lst, path_lst, node):
+def check_path_node(calling_node, del_lst, last_id, node):
     bool_check = False
-    bool_check = node.ID + 1 != path_lst[-1]
+    bool_check = node.ID + 1 != last_id
     if bool_check is True:
         bool_check = node not in del_lst
         if bool_check is True:
@@ -59,18 +395,18 @@ def remove_path_nodes(calling_node, graph, message):
     Return-type:
     None
     """
-    del_lst = []
-    ID_lst = [node.ID + 1 for node in graph.nodes()]
-    for node_id in ID_lst:
-        if node_id in message.path[:-1]:
-            index = ID_lst.index(node_id)
-            node = graph.nodes()[index]
-            del_lst.append(node)
+    del_set = set()
+    path_set = message.path_set
+    last_id = message.last_hop
+    for node in graph.nodes():
+        # path nodes except the last one
+        if node.ID + 1 in path_set and node.ID + 1 != last_id:
+            del_set.add(node)
             for neigh in graph.neighbors(node):
-                bool_check = check_path_node(calling_node, del_lst, message.path, neigh)
+                bool_check = check_path_node(calling_node, del_set, last_id, neigh)
                 if bool_check is True:
-                    del_lst.append(neigh)
-    graph.remove_nodes_from(del_lst)
+                    del_set.add(neigh)
+    graph.remove_nodes_from(del_set)
 
 
 def remove_edges(calling_node, graph):
@@ -167,6 +503,23 @@ def add_to_BRG(calling_node, graph, message):
 def build_BRG(calling_node, message):
     """Build the BRG-set of a message
 
+    Same result as build_BRG_graph, but computed on the LocalTwoHop
+    of the calling_node without building any graph.
+
+    Arguments:
+    calling_node -- Node object ; currently treated node
+    message -- Packet object ; currently treated message
+
+    Return-type:
+    None
+    """
+    local = get_local_two_hop(calling_node)
+    message.brg = local.brg(message.path_set, message.last_hop - 1)
+
+
+def build_BRG_graph(calling_node, message):
+    """Build the BRG-set of a message on a networkx graph
+
     Delete path-nodes and their neighbors and edges between one-hop-neighbors.
     As long as there are nodes in the graph delete isolated nodes,
     1-hop neighbors with degree 1 and then add suiting nodes to the BRG-set
@@ -188,6 +541,42 @@ def build_BRG(calling_node, message):
         add_to_BRG(calling_node, my_graph, message)
 
 
+def build_BRG_batch(calling_node, messages):
+    """Build the BRG-sets of all messages queued at a node
+
+    The neighborhood structure is set up once for all messages.
+    Messages with the same path nodes in the neighborhood share one BRG-set
+    computation; the others only differ in their path bitmasks.
+
+    Arguments:
+    calling_node -- Node object ; currently treated node
+    messages -- list of Packet objects ; usually the sending_buffer
+
+    Return-type:
+    None
+    """
+    if not messages:
+        return None
+    local = get_local_two_hop(calling_node)
+    contexts = {}
+    for message in messages:
+        last_id = message.last_hop - 1
+        one_path, two_path = local.path_masks(message.path_set, last_id)
+        key = local.context(one_path, two_path, last_id)
+        group = contexts.get(key)
+        if group is None:
+            contexts[key] = [message]
+        else:
+            group.append(message)
+    for key, group in contexts.items():
+        brg = local.lookup(key)
+        group[0].brg = brg
+        # the other messages of the group reuse the computed BRG-set
+        local.shared += len(group) - 1
+        for message in group[1:]:
+            message.brg = list(brg)
+
+
 def check_receive_buffer(calling_node, column):
     """Check the recieve-buffer for unknown messages and if oneself is in the BRG-set
 
@@ -201,8 +590,7 @@ def check_receive_buffer(calling_node, column):
             # add unknown messages to the data-list
         bool_ds = calling_node.check_data_stack(message)  # m in self.data_stack
         if bool_ds is False:
-            message.add_to_path(calling_node)
-            calling_node.data_stack.append(message)
+            calling_node.learn(message)
             # if oneself is in the BRG-Set add it to the sending-list
             if calling_node.ID in message.brg:
                 calling_node.sending_buffer.append(message)
@@ -0,0 +1,144 @@
+from __future__ import division
+from __future__ import print_function
+"""
+This file contains the adaptive sample allocation of the sweeps.
+Instead of a fixed number of samples, graphs are drawn until the confidence
+interval of the mean of every (size, connectivity bin, protocol) cell is
+narrow enough. For a drawn graph only the protocols whose cell still needs
+samples are simulated; graphs falling into finished bins cost
+only the graph generation and the eigenvalue computation.
+The records go into the same result files as the ones of create_plots,
+thus Main.plot_results plots them.
+"""
+import random
+import Main as mn
+import OnlineStats as ostats
+import RandomStreams as rs
+import ResultSink as sink
+
+PROTOCOLS = ('flooding', 'AHBP', 'SBA')
+
+
+def half_width(stats, z):
+    """Half width of the confidence interval of the mean"""
+    return z * stats.sem()
+
+
+def cell_done(stats, target, z, min_samples):
+    """
+    True if the cell has enough samples for its confidence interval
+
+    The half width has to be at most target times the mean; a cell whose
+    values are all the same is done after min_samples samples.
+    """
+    if stats is None or stats.count < min_samples:
+        return False
+    return half_width(stats, z) <= target * abs(stats.mean)
+
+
+def adaptive_sweep(sizes, results='results', seed=0, target=0.05, z=1.96,
+                   min_samples=5, budget=1000, max_draws=None,
+                   protocols=PROTOCOLS, metric='messages'):
+    """
+    Sample until every cell's confidence interval meets the target
+
+    Samples of the same root seed already in the result files count, so a
+    seeded sweep can be continued; an unseeded sweep starts from scratch.
+    Stops when all the connectivity bins seen so far are done or when the budget
+    of protocol runs (or the max_draws drawn graphs per size) is used up.
+
+    Arguments:
+    sizes -- graph sizes
+    results -- directory of the result files
+    seed -- root seed of the graphs and the timers (None -> global random)
+    target -- relative half width of the confidence interval of the mean
+    z -- quantile of the normal distribution of the confidence level
+    min_samples -- minimal number of samples per cell
+    budget -- maximal number of protocol runs over all sizes
+    max_draws -- maximal number of drawn graphs per size (default = 20 * budget)
+    protocols -- names of the protocols
+    metric -- metric whose confidence interval is checked
+
+    Return-type:
+    report -- list of (size, conn, protocol, count, mean, half width, done)
+    """
+    if max_draws is None:
+        max_draws = 20 * budget
+    # the records of an unseeded sweep are kept apart by their own id
+    sweep = seed if seed is not None else sink.new_sweep_id(results)
+    columns = sink.select(sink.read_results(results), seed=sweep)
+    runs = 0
+    stats = {}
+    with sink.ResultSink(results) as result_sink:
+        for size in sizes:
+            stats[size] = aggregator = ostats.StatsAggregator()
+            rows = sink.select(columns, size=size)
+            for protocol in protocols:
+                part = sink.select(rows, protocol=protocol)
+                aggregator.add_batch(protocol, part['conn'], **{metric: part[metric]})
+            sample = int(rows['sample'].max()) + 1 if len(rows['sample']) else 0
+            for draw in range(max_draws):
+                if runs >= budget or all_done(aggregator, protocols, metric,
+                                              target, z, min_samples):
+                    break
+                graph_rng = random
+                if seed is not None:
+                    graph_rng = rs.graph_stream(seed, (size, sample))
+                graph, laplacian = mn.random_graph(size, graph_rng)
+                conn = mn.round_connectivity(mn.get_connectivity(laplacian), size)
+                todo = [protocol for protocol in protocols
+                        if not cell_done(aggregator.stats.get((protocol, metric, conn)),
+                                         target, z, min_samples)]
+                records = []
+                for protocol in todo:
+                    mn.run_protocol(graph, protocol, seed, (size, sample))
+                    records.append(mn.run_record(graph, protocol, conn, size, sample, sweep))
+                    mn.clear_graph_data(graph)
+                    aggregator.add(protocol, conn, **{metric: records[-1][metric]})
+                    runs += 1
+                if records:
+                    result_sink.append(records)
+                sample += 1
+    report = []
+    for size in sizes:
+        aggregator = stats[size]
+        for protocol in protocols:
+            for conn in aggregator.bins(protocol, metric):
+                cell = aggregator.stats[(protocol, metric, conn)]
+                report.append((size, conn, protocol, cell.count, cell.mean,
+                               half_width(cell, z), cell_done(cell, target, z, min_samples)))
+    return report
+
+
+def all_done(aggregator, protocols, metric, target, z, min_samples):
+    """True if there is at least one bin and all bins of all protocols are done"""
+    cells = [aggregator.stats[(protocol, metric, conn)]
+             for protocol in protocols for conn in aggregator.bins(protocol, metric)]
+    if not cells:
+        return False
+    seen = set(conn for protocol in protocols for conn in aggregator.bins(protocol, metric))
+    for protocol in protocols:
+        if set(aggregator.bins(protocol, metric)) != seen:
+            return False
+    return all(cell_done(cell, target, z, min_samples) for cell in cells)
+
+
+def print_report(report):
+    """Print the achieved confidence intervals"""
+    print('size    conn  protocol  samples       mean  +/- half width  done')
+    for size, conn, protocol, count, mean, width, done in report:
+        print('{0:4} {1:7} {2:>9} {3:8} {4:10.1f}  +/- {5:10.2f}  {6}'.format(
+            size, conn, protocol, count, mean, width, 'yes' if done else 'no'))
+    done = sum(1 for row in report if row[-1])
+    print('{0} of {1} cells done, {2} samples'.format(done, len(report), sum(row[3] for row in report)))
+
+
+def main(sizes=(5,), results='results_adaptive', seed=0):
+    """Adaptive sweep with the default targets, then plot it"""
+    report = adaptive_sweep(sizes, results, seed)
+    print_report(report)
+    mn.plot_results(results, list(sizes), seed)
+
+
+if __name__ == '__main__':
+    main()
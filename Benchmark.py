@@ -0,0 +1,262 @@
+from __future__ import print_function
+"""
+This file contains benchmarks of the broadcasting simulations.
+Every benchmark runs on seeded graphs, so the numbers are comparable
+between runs, and checks that the compared versions send the same messages.
+
+The suite (run_suite, or python Benchmark.py --help) runs the protocols on a
+fixed corpus of line graphs, hexagonal lattices and random graphs,
+records time, peak memory and message counts of every case and compares
+them against a stored baseline.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import resource
+import sys
+import time
+import networkx as nx
+import Main as mn
+import AHBPClass as ahbp
+import FastBroadcast as fast
+import RandomStreams as rs
+
+# protocols of the suite; the ones working on Node objects are only run
+# up to the object limit, the array based ones also on the big graphs
+PROTOCOLS = ('flooding', 'AHBP', 'SBA', 'half_sba', 'half_sba_table',
+             'flooding_batches', 'half_sba_batches')
+OBJECT_PROTOCOLS = ('flooding', 'AHBP', 'SBA', 'half_sba')
+CORPUS_SIZES = (10, 100, 1000, 10000)
+
+
+class CallTimer(object):
+    """Temporarily wrap module functions to add up the time spent in them"""
+    def __init__(self, module, names):
+        self.module = module
+        self.names = names
+        self.originals = {}
+        self.total = 0.
+
+    def __enter__(self):
+        for name in self.names:
+            original = getattr(self.module, name)
+            self.originals[name] = original
+            setattr(self.module, name, self.wrap(original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self.originals.items():
+            setattr(self.module, name, original)
+
+    def wrap(self, func):
+        """Return func, adding its run time to total"""
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.total += time.time() - start
+        return timed
+
+
+def brg_benchmark(sizes=(10, 20, 40), samples=3, root_seed=0):
+    """
+    Compare the BRG-set computations in an all-to-all AHBP broadcast
+
+    For each size run setup_sending_AHBP with the networkx based BRG-sets,
+    the bitmask BRG-sets message by message and the batched BRG-sets.
+    Print the time spent building BRG-sets and the total time of the broadcast.
+
+    Arguments:
+    sizes -- graph sizes to run
+    samples -- number of random graphs per size
+    root_seed -- seed of the graph generation
+
+    Return-type:
+    results -- dict with (size, mode) as key and [BRG time, total time] as value
+    """
+    modes = ('graph', 'single', 'batch')
+    brg_functions = ['build_BRG_graph', 'build_BRG', 'build_BRG_batch']
+    results = {}
+    print('size  ' + '  '.join('{0:>15}'.format(mode) for mode in modes) + '  BRG speedup')
+    for size in sizes:
+        for mode in modes:
+            results[(size, mode)] = [0., 0.]
+        for sample in range(samples):
+            graph, laplacian = mn.random_graph(size, rs.graph_stream(root_seed, (size, sample)))
+            counts = []
+            for mode in modes:
+                with CallTimer(ahbp, brg_functions) as timer:
+                    start = time.time()
+                    mn.setup_sending_AHBP(graph, mode)
+                    results[(size, mode)][1] += time.time() - start
+                results[(size, mode)][0] += timer.total
+                counts.append(mn.get_message_counter(graph))
+                mn.clear_graph_data(graph)
+            assert counts.count(counts[0]) == len(counts), counts
+        times = [results[(size, mode)] for mode in modes]
+        print('{0:4}  '.format(size) +
+              '  '.join('{0:7.3f}/{1:7.3f}'.format(*t) for t in times) +
+              '  {0:11.1f}'.format(times[0][0] / times[-1][0]))
+    return results
+
+
+def build_corpus(sizes=CORPUS_SIZES, samples=1, root_seed=0):
+    """
+    Build the topology corpus of the suite
+
+    For every size a line graph (build_line_laplacian), a hexagonal lattice
+    with about size nodes (lattice_graph) and samples random graphs
+    (build_rand_nx_graph on a lattice of about 1.25 size nodes).
+    All laplacians are sparse, thus 10^4 nodes fit into memory.
+
+    Return-type:
+    corpus -- list of (name, laplacian) with name = kind/size/sample
+    """
+    corpus = []
+    for size in sizes:
+        corpus.append(('line/{0}/0'.format(size), mn.build_line_laplacian(size, sparse=True)))
+        length = int(round(math.sqrt(size)))
+        lattice = nx.convert_node_labels_to_integers(mn.lattice_graph(length))
+        corpus.append(('lattice/{0}/0'.format(size), mn.sparse_laplacian(lattice)))
+        length = int(math.ceil(math.sqrt(1.25 * size)))
+        for sample in range(samples):
+            rng = rs.graph_stream(root_seed, ('bench', size, sample))
+            graph = mn.build_rand_nx_graph(size, rng, length)
+            corpus.append(('random/{0}/{1}'.format(size, sample), mn.sparse_laplacian(graph)))
+    return corpus
+
+
+def run_protocol(protocol, graph, name, root_seed=0, timer=2):
+    """
+    Run a protocol on a graph with Main.run_protocol
+
+    Return-type:
+    counts -- dict with messages, max_load and rebroadcaster
+    """
+    messages, max_load, rebroad = mn.run_protocol(graph, protocol, root_seed, name, timer)
+    return {'messages': int(messages), 'max_load': int(max_load),
+            'rebroadcaster': int(rebroad)}
+
+
+def measure_case(protocol, name, laplacian, root_seed, connection):
+    """
+    Child process of a case: build the graph, run the protocol, report
+
+    The peak memory is the growth of ru_maxrss (kB on Linux) during the case,
+    the memory inherited from the parent does not count.
+    """
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    graph = mn.setup_graph(laplacian)
+    setup_time = time.time() - start
+    start = time.time()
+    result = run_protocol(protocol, graph, name, root_seed)
+    result['time'] = time.time() - start
+    result['setup_time'] = setup_time
+    result['memory'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    connection.send(result)
+    connection.close()
+
+
+def run_case(protocol, name, laplacian, root_seed=0):
+    """Run one case in its own process, so the peak memory is its own"""
+    parent, child = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=measure_case,
+                                      args=(protocol, name, laplacian, root_seed, child))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def run_suite(sizes=CORPUS_SIZES, samples=1, protocols=PROTOCOLS, object_limit=100,
+              root_seed=0):
+    """
+    Run all protocols on the corpus
+
+    Arguments:
+    sizes -- graph sizes of the corpus
+    samples -- number of random graphs per size
+    protocols -- protocols to run
+    object_limit -- biggest graph for the protocols on Node objects
+    root_seed -- seed of the random graphs and the SBA timers
+
+    Return-type:
+    results -- dict with protocol/kind/size/sample as key and a dict with
+               time, setup_time, memory, messages, max_load, rebroadcaster
+    """
+    results = {}
+    for name, laplacian in build_corpus(sizes, samples, root_seed):
+        for protocol in protocols:
+            if protocol in OBJECT_PROTOCOLS and laplacian.shape[0] > object_limit:
+                continue
+            key = protocol + '/' + name
+            results[key] = run_case(protocol, name, laplacian, root_seed)
+            print('{0:35} {1:9.3f}s {2:9}kB {3:10}'.format(
+                key, results[key]['time'], results[key]['memory'], results[key]['messages']))
+    return results
+
+
+def compare(results, baseline, time_threshold=0.25, memory_threshold=0.25,
+            min_time=0.05, min_memory=1024):
+    """
+    Compare results against a baseline
+
+    A case regresses if its time or memory grew by more than the threshold
+    (relative, and more than min_time seconds or min_memory kB absolute)
+    or if it sends other numbers of messages.
+
+    Return-type:
+    regressions -- list of strings describing the regressions
+    """
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        new, old = results[key], baseline[key]
+        for count in ('messages', 'max_load', 'rebroadcaster'):
+            if new[count] != old[count]:
+                regressions.append('{0}: {1} {2} -> {3}'.format(key, count, old[count], new[count]))
+        for metric, threshold, minimum in (('time', time_threshold, min_time),
+                                           ('memory', memory_threshold, min_memory)):
+            if (new[metric] > old[metric] * (1 + threshold) and
+                    new[metric] - old[metric] > minimum):
+                regressions.append('{0}: {1} {2:.3f} -> {3:.3f}'.format(
+                    key, metric, old[metric], new[metric]))
+    return regressions
+
+
+def main(argv=None):
+    """Command line interface of the benchmark suite"""
+    parser = argparse.ArgumentParser(description='Benchmark the broadcast protocols')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(CORPUS_SIZES))
+    parser.add_argument('--samples', type=int, default=1)
+    parser.add_argument('--protocols', nargs='+', default=list(PROTOCOLS), choices=PROTOCOLS)
+    parser.add_argument('--object-limit', type=int, default=100,
+                        help='biggest graph for the protocols on Node objects')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help='JSON file with the results to compare against')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--time-threshold', type=float, default=0.25)
+    parser.add_argument('--memory-threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.samples, args.protocols,
+                        args.object_limit, args.seed)
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+This file contains the common interface of the broadcast algorithms
+and the driver loop running all of them.
+A protocol only says what a node does with incoming messages (on_receive,
+should_forward), what happens after all nodes received (on_round_end),
+to whom a node sends (neighbors) and when the broadcast is done (converged).
+Buffering, the order of the phases, the dynamic topology and the
+termination are handled by run_broadcast for all protocols alike.
+"""
+import Package as pac
+import Profiler as prof
+import SBAClass as sba
+import AHBPClass as ahbp
+import HelloProtocol as hello_prot
+
+
+def init_neighborhood(graph, hello):
+    """
+    Give every node its two-hop neighborhood
+
+    Either read it out of the master graph or run the hello protocol.
+    run_broadcast clears the hello state before a run on a static graph,
+    so every run pays for its whole discovery; only the rounds of one
+    DynamicNetwork run build on each other.
+    """
+    if hello:
+        hello_prot.discover(graph)
+    else:
+        for node in graph.nodes():
+            node.build_2_hop(graph)
+
+
+def all_known(graph):
+    """True if all nodes in the graph got all messages"""
+    size = len(graph)
+    for node in graph.nodes_iter():
+        if len(node.data_stack) < size:
+            return False
+    return True
+
+
+def traffic(nodes):
+    """
+    Count what is on the way after a sending phase
+
+    Return-type:
+    copies -- number of packet copies in the receive_buffers (deepcopies)
+    deliveries -- number of received copies including the merged ones
+    """
+    copies = deliveries = 0
+    for node in nodes:
+        copies += len(node.receive_buffer)
+        for message in node.receive_buffer:
+            deliveries += len(message.senders)
+    return copies, deliveries
+
+
+def advance_network(network, iteration):
+    """
+    Apply the topology changes of a dynamic network before a round
+
+    Arguments:
+    network -- DynamicTopology.DynamicNetwork instance or None for a static graph
+    iteration -- the upcoming round
+
+    Return-type:
+    False -- if the round limit of the network is reached, else True
+    """
+    if network is None:
+        return True
+    if iteration >= network.max_rounds:
+        return False
+    network.advance(iteration)
+    return True
+
+
+class BroadcastProtocol(object):
+    """
+    Base class of the broadcast algorithms; behaves like pure flooding
+
+    class attributes:
+    flag -- name of the algorithm
+    max_rounds -- round limit, None -> run until converged
+    path_tracking -- 'off', 'last' or 'full', see Package.path_tracking;
+                     only the AHBP needs the paths, the others run without
+    path_hops -- number of hops kept with 'last'
+    hello -- True if the neighborhood is discovered by the hello protocol
+    profiler -- Profiler instance of the current run, set by run_broadcast
+    tracking -- path tracking policy of the current run, set by run_broadcast
+    """
+    flag = 'flooding'
+    max_rounds = None
+    path_tracking = 'off'
+    path_hops = 2
+    hello = False
+    profiler = prof.NULL_PROFILER
+    tracking = None
+
+    def setup(self, graph):
+        """Initiate all nodes with a data packet"""
+        for node in graph.nodes():
+            node.init_1_data(self.tracking)
+
+    def neighbors(self, graph, node):
+        """Nodes which get the sending_buffer of node"""
+        return graph.neighbors(node)
+
+    def should_forward(self, node, message):
+        """Decide if a newly learned message is rebroadcast"""
+        return True
+
+    def on_receive(self, node, iteration):
+        """
+        Process the receive_buffer of a node
+
+        Unknown messages are added to the data_stack and, if should_forward
+        agrees, to the sending_buffer.
+        """
+        for message in node.receive_buffer:
+            if not node.check_data_stack(message):
+                node.learn(message)
+                if self.should_forward(node, message):
+                    node.sending_buffer.append(message)
+        node.del_receive_buffer()
+
+    def on_round_end(self, graph, iteration):
+        """Called after all nodes processed their receive_buffer"""
+        pass
+
+    def converged(self, graph):
+        """True if the broadcast is done"""
+        return all_known(graph)
+
+
+class Flooding(BroadcastProtocol):
+    """Every node rebroadcasts every new message to all neighbors"""
+    flag = 'flooding'
+
+
+class HalfSBA(BroadcastProtocol):
+    """SBA without random timers: forward unless the last node covers all neighbors"""
+    flag = 'half_sba'
+
+    def __init__(self, hello=False):
+        self.hello = hello
+
+    def setup(self, graph):
+        init_neighborhood(graph, self.hello)
+        BroadcastProtocol.setup(self, graph)
+
+    def neighbors(self, graph, node):
+        return node.two_hop_dict.keys()
+
+    def should_forward(self, node, message):
+        return not sba.check_neigh(node, message.last_node)
+
+
+class SBA(BroadcastProtocol):
+    """
+    Scalable Broadcast Algorithm, see SBAClass
+
+    Done if all messages are known and no timer and no sending is pending.
+    On a static graph nothing would happen anymore, thus stopping
+    early gives the same numbers as running all max_rounds rounds.
+    A dynamic network keeps changing and sending hellos, so there the
+    broadcast runs all max_rounds rounds, see run_broadcast.
+    """
+    flag = 'SBA'
+    max_rounds = 100
+
+    def __init__(self, timer, hello=False):
+        self.timer = timer
+        self.hello = hello
+
+    def setup(self, graph):
+        init_neighborhood(graph, self.hello)
+        BroadcastProtocol.setup(self, graph)
+
+    def neighbors(self, graph, node):
+        return node.two_hop_dict.keys()
+
+    def on_receive(self, node, iteration):
+        sba.check_receive_buffer(node, iteration, self.timer)
+
+    def on_round_end(self, graph, iteration):
+        for node in graph.nodes():
+            sba.update_packet_dict(node, iteration)
+
+    def converged(self, graph):
+        for node in graph.nodes_iter():
+            if node.packet_dict or node.sending_buffer:
+                return False
+        return all_known(graph)
+
+
+class AHBP(BroadcastProtocol):
+    """
+    Ad Hoc Broadcast Protocol, see AHBPClass
+
+    Arguments:
+    brg -- how the BRG-sets are built: 'batch' -> all messages of a node at once,
+           'single' -> message by message, 'graph' -> with networkx graphs
+    precompute -- precompute the BRG-sets of all nodes in a process pool
+    processes -- size of the process pool for the precomputation
+    hello -- if True the neighborhood is discovered by the hello protocol
+    """
+    flag = 'AHBP'
+    path_tracking = 'full'
+
+    def __init__(self, brg='batch', precompute=False, processes=None, hello=False):
+        self.brg = brg
+        self.precompute = precompute
+        self.processes = processes
+        self.hello = hello
+
+    def setup(self, graph):
+        init_neighborhood(graph, self.hello)
+        BroadcastProtocol.setup(self, graph)
+        if self.precompute:
+            ahbp.precompute_relay_tables(graph, processes=self.processes)
+
+    def neighbors(self, graph, node):
+        return node.two_hop_dict.keys()
+
+    def on_receive(self, node, iteration):
+        ahbp.check_receive_buffer(node, iteration)
+        node.del_receive_buffer()
+        # for all messages in the sending_buffer build the BRG-Set
+        with self.profiler.phase('brg'):
+            if self.brg == 'batch':
+                ahbp.build_BRG_batch(node, node.sending_buffer)
+            elif self.brg == 'single':
+                for message in node.sending_buffer:
+                    ahbp.build_BRG(node, message)
+            else:
+                for message in node.sending_buffer:
+                    ahbp.build_BRG_graph(node, message)
+
+
+def run_broadcast(graph, protocol, network=None, profiler=None):
+    """
+    Perform the sending process of a broadcast protocol
+
+    Every round consists of
+    - the topology changes of a dynamic network
+    - all nodes process their receive_buffer -> on_receive
+    - on_round_end
+    - the check whether the protocol is done; with a dynamic network a
+      protocol with a round limit runs on up to it, since the topology
+      changes and their hellos go on after the broadcast is done
+    - all nodes push their sending_buffer to their neighbors
+    Receiving and sending are split, so a message traverses
+    only one edge per round.
+    At the end the remaining sending_buffers are flushed to all neighbors.
+    The nodes count their sends and receptions in the metrics store of the
+    graph (graph.graph['metrics']) under the current round; a message
+    learned while processing the receive_buffer in round r has its first
+    receipt in round r.
+
+    With a Profiler.PhaseProfiler every phase is timed and after each sending
+    phase the transmissions, copies and deliveries of the round are recorded.
+    The 'brg' phase of the AHBP is part of the 'receive' phase.
+
+    Arguments:
+    graph -- a graph with node instances as vertices
+    protocol -- BroadcastProtocol instance
+    network -- DynamicTopology.DynamicNetwork changing the graph between rounds
+    profiler -- Profiler.PhaseProfiler instance (default = no instrumentation)
+
+    Return-type:
+    iteration -- number of rounds with sending
+    """
+    if profiler is None:
+        profiler = prof.NULL_PROFILER
+    protocol.profiler = profiler
+    # one policy per run, the path tree of a broadcast is dropped with its packets
+    protocol.tracking = pac.path_tracking(protocol.path_tracking, protocol.path_hops)
+    metrics = graph.graph['metrics']
+    if protocol.hello and network is None:
+        # the hellos of an earlier run must not make this one cheaper
+        hello_prot.reset_neighborhood(graph)
+    # the own messages are learned in round 0
+    metrics.start_round(0)
+    with profiler.phase('setup'):
+        protocol.setup(graph)
+    nodes = graph.nodes()
+    iteration = 0
+    sent = 0
+    while protocol.max_rounds is None or iteration < protocol.max_rounds:
+        metrics.start_round(iteration)
+        with profiler.phase('topology'):
+            go_on = advance_network(network, iteration)
+        if not go_on:
+            break
+        with profiler.phase('receive'):
+            for node in nodes:
+                protocol.on_receive(node, iteration)
+        with profiler.phase('round_end'):
+            protocol.on_round_end(graph, iteration)
+        with profiler.phase('converged'):
+            done = protocol.converged(graph)
+        if done and (network is None or protocol.max_rounds is None):
+            break
+        if profiler.enabled:
+            sent = metrics.sends[iteration].sum()
+        with profiler.phase('send'):
+            for node in nodes:
+                if node.sending_buffer:
+                    node.send_to_neighbor(protocol.neighbors(graph, node))
+                    node.del_sending_buffer()
+        if profiler.enabled:
+            copies, deliveries = traffic(nodes)
+            transmissions = int(metrics.sends[iteration].sum() - sent)
+            profiler.round_stats(iteration, transmissions=transmissions,
+                                 copies=copies, deliveries=deliveries)
+            # every copy is checked once against the data_stack next round
+            profiler.count('deepcopy', copies)
+            profiler.count('check_data_stack', copies)
+            profiler.count('merged', deliveries - copies)
+        iteration += 1
+    metrics.start_round(iteration)
+    with profiler.phase('flush'):
+        for node in nodes:
+            node.send_to_neighbor(graph.neighbors(node))
+    profiler.count('rounds', iteration)
+    return iteration
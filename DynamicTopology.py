@@ -0,0 +1,208 @@
+from __future__ import division
+"""
+This file contains the dynamic topology mode.
+Between the rounds of a broadcast links come up and break, either because
+the nodes move (random walk, links between nodes closer than a radius)
+or because a churn trace says so.
+Only the neighborhoods of the nodes next to a changed link are updated:
+with the hello protocol the endpoints just get a link notification,
+otherwise the two-hop dicts of the endpoints and their neighbors are rebuilt.
+The laplacian is updated entry by entry, the algebraic connectivity
+is only recomputed when it is asked for.
+"""
+import random
+import numpy as np
+import networkx as nx
+import HelloProtocol as hello_prot
+
+
+class DynamicNetwork(object):
+    """
+    Graph whose links change between the rounds
+
+    Pass an instance as network to the setup_sending_* functions in Main,
+    they call advance(iteration) at the beginning of every round.
+
+    class attributes:
+    max_rounds -- round limit of the broadcasts, the graph may be disconnected
+    """
+    max_rounds = 100
+
+    def __init__(self, graph, hello=False, positions=None, radius=None,
+                 step=0., trace=None, rng=random):
+        """
+        Initialize a dynamic network
+
+        Instance attributes:
+        graph -- networkx.Graph with Node instances; changed in place
+        nodes -- list of the nodes in graph.nodes() order
+        index -- dict node -> index in nodes
+        hello -- True if the nodes keep their neighborhood by the hello protocol
+        positions -- numpy array (n, 2) with the node positions or None
+        radius -- communication radius of the mobility model
+        step -- distance a node moves per round
+        trace -- dict iteration -> list of ('up'/'down', index_1, index_2)
+        rng -- random generator of the mobility model
+        laplacian -- numpy array; laplacian of the current graph
+        changes -- list with the number of link changes per advance
+        """
+        self.graph = graph
+        self.nodes = graph.nodes()
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))
+        self.hello = hello
+        self.positions = None if positions is None else np.array(positions, dtype=float)
+        self.radius = radius
+        self.step = step
+        self.trace = {}
+        for iteration, kind, index_1, index_2 in trace or []:
+            self.trace.setdefault(iteration, []).append((kind, index_1, index_2))
+        self.rng = rng
+        self.laplacian = nx.laplacian_matrix(graph, nodelist=self.nodes).getA().astype(float)
+        self._connectivity = None
+        self.changes = []
+
+    def insert_edge(self, node_1, node_2):
+        """Add a link; returns False if it already exists"""
+        if node_1 is node_2 or self.graph.has_edge(node_1, node_2):
+            return False
+        self.graph.add_edge(node_1, node_2)
+        self.update_laplacian(node_1, node_2, 1)
+        if self.hello:
+            hello_prot.link_up(node_1, node_2)
+        return True
+
+    def delete_edge(self, node_1, node_2):
+        """Remove a link; returns False if there is none"""
+        if not self.graph.has_edge(node_1, node_2):
+            return False
+        self.graph.remove_edge(node_1, node_2)
+        self.update_laplacian(node_1, node_2, -1)
+        if self.hello:
+            hello_prot.link_down(node_1, node_2)
+        return True
+
+    def update_laplacian(self, node_1, node_2, sign):
+        """Change the four laplacian entries of a link"""
+        i, j = self.index[node_1], self.index[node_2]
+        self.laplacian[i, i] += sign
+        self.laplacian[j, j] += sign
+        self.laplacian[i, j] -= sign
+        self.laplacian[j, i] -= sign
+        self._connectivity = None
+
+    def connectivity(self):
+        """Algebraic connectivity of the current graph, computed lazily"""
+        if self._connectivity is None:
+            self._connectivity = np.linalg.eigvalsh(self.laplacian)[1]
+        return self._connectivity
+
+    def move(self):
+        """
+        Random walk of all nodes and the resulting link changes
+
+        Every node moves step into a random direction. Two nodes are linked
+        if their distance is at most radius.
+
+        Return-type:
+        changes -- list of ('up'/'down', index_1, index_2)
+        """
+        size = len(self.nodes)
+        angle = np.array([self.rng.uniform(0, 2 * np.pi) for i in range(size)])
+        self.positions[:, 0] += self.step * np.cos(angle)
+        self.positions[:, 1] += self.step * np.sin(angle)
+        diff = self.positions[:, None, :] - self.positions[None, :, :]
+        linked = (diff ** 2).sum(axis=2) <= self.radius ** 2
+        # off-diagonal laplacian entries are -1 for existing links
+        current = self.laplacian < 0
+        up = np.argwhere(np.triu(linked & ~current, 1))
+        down = np.argwhere(np.triu(current & ~linked, 1))
+        changes = [('up', i, j) for i, j in up]
+        changes += [('down', i, j) for i, j in down]
+        return changes
+
+    def apply(self, changes):
+        """
+        Apply link changes and update the affected neighborhoods
+
+        Arguments:
+        changes -- list of ('up'/'down', index_1, index_2)
+
+        Return-type:
+        applied -- number of links which actually changed
+        """
+        touched = set()
+        applied = 0
+        for kind, index_1, index_2 in changes:
+            node_1, node_2 = self.nodes[index_1], self.nodes[index_2]
+            if kind == 'up':
+                changed = self.insert_edge(node_1, node_2)
+            else:
+                changed = self.delete_edge(node_1, node_2)
+            if changed:
+                applied += 1
+                touched.update((node_1, node_2))
+        if not self.hello:
+            # the 2-hop lists of the neighbors of an endpoint change as well
+            affected = set(touched)
+            for node in touched:
+                affected.update(self.graph.neighbors(node))
+            for node in affected:
+                node.two_hop_dict = {}
+                node.build_2_hop(self.graph)
+        return applied
+
+    def advance(self, iteration):
+        """
+        Perform the topology changes before the round iteration
+
+        With the hello protocol one hello round follows the changes,
+        thus new links are known to the nodes a few rounds later.
+
+        Return-type:
+        applied -- number of links which changed
+        """
+        changes = list(self.trace.get(iteration, []))
+        if self.positions is not None and self.step:
+            changes += self.move()
+        applied = self.apply(changes)
+        if self.hello:
+            hello_prot.hello_round(self.graph)
+        self.changes.append(applied)
+        return applied
+
+
+def unit_disk_positions(size, rng=random):
+    """Random positions in the unit square"""
+    return np.array([[rng.random(), rng.random()] for i in range(size)])
+
+
+def unit_disk_laplacian(positions, radius):
+    """Laplacian of the graph linking all nodes closer than radius"""
+    diff = positions[:, None, :] - positions[None, :, :]
+    adjacency = ((diff ** 2).sum(axis=2) <= radius ** 2).astype(float)
+    np.fill_diagonal(adjacency, 0)
+    return np.diag(adjacency.sum(axis=1)) - adjacency
+
+
+def churn_trace(graph, rounds, failures, duration, rng=random):
+    """
+    Random churn trace: links break and come back after duration rounds
+
+    Arguments:
+    graph -- networkx.Graph with Node instances
+    rounds -- number of rounds with failures
+    failures -- number of link failures per round
+    duration -- number of rounds a failed link stays down
+
+    Return-type:
+    trace -- list of (iteration, 'up'/'down', index_1, index_2)
+    """
+    index = dict((node, i) for i, node in enumerate(graph.nodes()))
+    edges = [(index[node_1], index[node_2]) for node_1, node_2 in graph.edges()]
+    trace = []
+    for iteration in range(rounds):
+        for k in range(min(failures, len(edges))):
+            index_1, index_2 = edges[rng.randint(0, len(edges) - 1)]
+            trace.append((iteration, 'down', index_1, index_2))
+            trace.append((iteration + duration, 'up', index_1, index_2))
+    return trace
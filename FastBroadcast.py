@@ -0,0 +1,578 @@
+from __future__ import division
+"""
+This file contains array based versions of the broadcasting algorithms.
+Instead of pushing Packet objects through the Node instances, the topology is
+compiled once into index arrays and the broadcasts are computed on those.
+Note that the node order of graph.nodes() is kept, since it decides which
+copy of a message arrives first at a node.
+run_batches moves message sets instead of single messages: the known and
+the sent messages of a node are bitmasks over the origins, one transmission
+carries all messages a node sends in a round. When only a few words of the
+sent bitmasks are nonzero, only those travel, so long paths do not pay for
+the whole bitmask.
+"""
+import numpy as np
+
+
+class Topology(object):
+    """Index based representation of a graph with Node instances"""
+    def __init__(self, graph):
+        """
+        Compile the graph into CSR arrays
+
+        Instance attributes:
+        nodes -- list with the Node objects in the order of graph.nodes()
+        index -- dict mapping a Node object to its position in nodes
+        size -- number of nodes
+        indptr -- neighbors of i are indices[indptr[i]:indptr[i + 1]]
+        indices -- concatenated and sorted neighbor positions
+        degree -- numpy array with the degree of each node
+        """
+        self.nodes = graph.nodes()
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))
+        self.size = len(self.nodes)
+        neigh_lst = [sorted(self.index[neigh] for neigh in graph.neighbors(node))
+                     for node in self.nodes]
+        self.degree = np.array([len(lst) for lst in neigh_lst], dtype=np.int64)
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(self.degree)
+        if self.size and self.indptr[-1]:
+            self.indices = np.concatenate([np.array(lst, dtype=np.int64) for lst in neigh_lst])
+        else:
+            self.indices = np.zeros(0, dtype=np.int64)
+
+    def neighbors(self, i):
+        """Return the neighbor positions of node i as numpy array"""
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def edge_range(self, rows):
+        """
+        Return the CSR positions of all edges leaving the given rows
+
+        The positions are grouped by row in the order of rows.
+        """
+        starts = self.indptr[rows]
+        lens = self.indptr[rows + 1] - starts
+        offsets = np.cumsum(lens) - lens
+        return np.arange(lens.sum()) - np.repeat(offsets, lens) + np.repeat(starts, lens)
+
+    def edge_sources(self):
+        """Return the sending node of every CSR position"""
+        return np.repeat(np.arange(self.size), self.degree)
+
+
+def half_sba_table(topology):
+    """
+    Compile the forwarding decision of the half-SBA for every directed edge
+
+    A node forwards a newly learned message exactly when the neighborhood of
+    the node the message came from does not cover its own neighborhood
+    -> same as 'not sba.check_neigh(node, message.last_node)'
+
+    Arguments:
+    topology -- Topology instance
+
+    Return-type:
+    forward -- bool array over the CSR positions; forward[e] is True if the
+               receiving node indices[e] forwards a message first heard from
+               the row of e
+    """
+    neigh_sets = [set(topology.neighbors(i).tolist()) for i in range(topology.size)]
+    forward = np.zeros(len(topology.indices), dtype=bool)
+    sources = topology.edge_sources()
+    for e in range(len(topology.indices)):
+        sender = sources[e]
+        receiver = topology.indices[e]
+        uncovered = neigh_sets[receiver] - neigh_sets[sender]
+        uncovered.discard(sender)
+        forward[e] = bool(uncovered)
+    return forward
+
+
+def count_forwards(topology, origins, forwarders):
+    """
+    Count the transmissions of forwarding events like Node.send_to_neighbor
+
+    A node only transmits a message if it has a neighbor apart from the
+    node the message came from. The origin has no such node.
+
+    Arguments:
+    topology -- Topology instance
+    origins -- int array with the origin position of each event
+    forwarders -- int array with the forwarding node position of each event
+
+    Return-type:
+    sends -- number of transmitting events per node
+    senders -- bool array; True for nodes rebroadcasting foreign messages
+    """
+    own = origins == forwarders
+    sending = np.where(own, topology.degree[forwarders] > 0, topology.degree[forwarders] > 1)
+    sends = np.bincount(forwarders[sending], minlength=topology.size)
+    foreign = forwarders[sending & ~own]
+    senders = np.zeros(topology.size, dtype=bool)
+    senders[foreign] = True
+    return sends, senders
+
+
+def summarize(sends, senders):
+    """
+    Compute the same numbers as Main.get_message_counter and Main.get_num_sender
+
+    Every transmission is counted with 5, see Node.send_to_neighbor.
+
+    Return-type:
+    total_number -- total number of sent messages
+    max_number -- max load of any node without its own message
+    rebroadcaster -- number of retransmitting nodes
+    """
+    total_number = 5 * int(sends.sum())
+    max_number = 5 * int(sends.max()) - 5 if len(sends) else -5
+    return total_number, max_number, int(senders.sum())
+
+
+def run_half_sba(topology, forward=None):
+    """
+    Perform the all-to-all broadcast of the half-SBA on the compiled topology
+
+    All origins are traversed at once. The frontier is a list of
+    (origin, node) pairs sorted by origin and node position, so the first
+    arriving copy of a message at a node is the one of the first sender
+    in graph.nodes() order -- as in the receive_buffer of the object simulation.
+
+    Arguments:
+    topology -- Topology instance
+    forward -- result of half_sba_table (computed if not given)
+
+    Return-type:
+    sends -- number of transmitting events per node
+    senders -- bool array with the retransmitting nodes
+    rounds -- number of iterations until every node knows every message
+    """
+    if forward is None:
+        forward = half_sba_table(topology)
+    size = topology.size
+    known = np.eye(size, dtype=bool)
+    front_origin = np.arange(size)
+    front_node = np.arange(size)
+    all_origins = [front_origin]
+    all_forwarders = [front_node]
+    rounds = 0
+    while len(front_node):
+        edges = topology.edge_range(front_node)
+        lens = topology.degree[front_node]
+        origin = np.repeat(front_origin, lens)
+        dst = topology.indices[edges]
+        fresh = ~known[origin, dst]
+        edges, origin, dst = edges[fresh], origin[fresh], dst[fresh]
+        if not len(dst):
+            break
+        rounds += 1
+        keys, first = np.unique(origin * size + dst, return_index=True)
+        known[keys // size, keys % size] = True
+        keep = forward[edges[first]]
+        front_origin = keys[keep] // size
+        front_node = keys[keep] % size
+        all_origins.append(front_origin)
+        all_forwarders.append(front_node)
+    sends, senders = count_forwards(topology, np.concatenate(all_origins),
+                                    np.concatenate(all_forwarders))
+    return sends, senders, rounds
+
+
+def reverse_edges(topology):
+    """
+    Return for every CSR position the position of the opposite edge
+
+    reverse[e] is the position of (indices[e], row of e), thus the table
+    of the receiving side of a transmission over e.
+    """
+    sources = topology.edge_sources()
+    order = np.lexsort((sources, topology.indices))
+    reverse = np.empty(len(order), dtype=np.int64)
+    reverse[order] = np.arange(len(order))
+    return reverse
+
+
+def message_masks(size, rows=None):
+    """Return empty bitmasks of size messages (one bit each) for rows nodes"""
+    words = max(1, int(np.ceil(size / 64.)))
+    return np.zeros((size if rows is None else rows, words), dtype=np.uint64)
+
+
+def own_masks(size):
+    """Return the bitmasks with the own message of every node"""
+    masks = message_masks(size)
+    positions = np.arange(size)
+    masks[positions, positions // 64] = np.uint64(1) << (positions % 64).astype(np.uint64)
+    return masks
+
+
+def popcount(masks):
+    """Return the number of set bits of every row of a bitmask array (SWAR)"""
+    x = masks - ((masks >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    x = (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+    return x.sum(axis=1, dtype=np.int64)
+
+
+def mask_bits(masks, size):
+    """Return the bitmasks as uint8 array (rows, size) of 0/1; bit j of a row -> column j"""
+    bits = np.unpackbits(masks.view(np.uint8), axis=1)
+    # unpackbits starts with the highest bit of each (little endian) byte
+    bits = bits.reshape(len(masks), -1, 8)[:, :, ::-1].reshape(len(masks), -1)
+    return bits[:, :size]
+
+
+def receipt_rounds(planes, known, size):
+    """
+    Assemble the first-receipt rounds out of bit planes
+
+    Bit b of the round in which node i learned origin j is bit j of planes[b][i].
+
+    Return-type:
+    first -- int32 array (node position, origin position), -1 if never learned
+    """
+    first = np.zeros((size, size), dtype=np.int32)
+    for b, plane in enumerate(planes):
+        first += mask_bits(plane, size).astype(np.int32) << b
+    first[mask_bits(known, size) == 0] = -1
+    return first
+
+
+def dense_batch_round(topology, known, front, f_node, f_word, f_bits, reverse_forward):
+    """
+    Deliver the sending sets of one round as whole bitmask rows
+
+    The neighbors of every receiving node are handled by ascending position,
+    one neighbor rank at a time for all receiving nodes at once.
+
+    Arguments:
+    topology -- Topology instance
+    known -- bitmasks of the known messages
+    front -- all-zero bitmasks of all nodes, used for the sending sets
+    f_node, f_word, f_bits -- the sending sets as entries of their nonzero words
+    reverse_forward -- forward table over the receiving side of the edges,
+                       None -> flooding
+
+    Return-type:
+    learned -- index of known: the receiving nodes
+    fresh -- bitmasks of their new messages
+    n_node, n_word, n_bits -- the sending sets of the next round
+    """
+    size = topology.size
+    front[f_node, f_word] = f_bits
+    receivers = np.unique(topology.indices[topology.edge_range(np.unique(f_node))])
+    seen = known[receivers]
+    fresh = message_masks(size, len(receivers))
+    next_front = message_masks(size, len(receivers))
+    degree = topology.degree[receivers]
+    for rank in range(int(degree.max()) if len(receivers) else 0):
+        sel = np.flatnonzero(degree > rank)
+        edges = topology.indptr[receivers[sel]] + rank
+        batch = front[topology.indices[edges]] & ~(seen[sel] | fresh[sel])
+        fresh[sel] |= batch
+        if reverse_forward is None:
+            next_front[sel] |= batch
+        else:
+            keep = reverse_forward[edges]
+            next_front[sel[keep]] |= batch[keep]
+    front[f_node, f_word] = 0
+    rows, n_word = np.nonzero(next_front)
+    return receivers, fresh, receivers[rows], n_word, next_front[rows, n_word]
+
+
+def sparse_batch_round(topology, known, f_node, f_word, f_bits, forward):
+    """
+    Deliver the sending sets of one round word by word
+
+    Same result as dense_batch_round, but only the nonzero words travel:
+    the copies are grouped by (receiver, word) and handled by ascending
+    sender position, one sender rank at a time for all the pairs at once.
+    forward is the forward table over the sending side of the edges.
+
+    Return-type:
+    learned -- index of known: the (receiver, word) pairs
+    fresh -- their new messages
+    n_node, n_word, n_bits -- the sending sets of the next round
+    """
+    words = known.shape[1]
+    degree = topology.degree[f_node]
+    edges = topology.edge_range(f_node)
+    group_key = topology.indices[edges] * words + np.repeat(f_word, degree)
+    order = np.lexsort((np.repeat(f_node, degree), group_key))
+    edges = edges[order]
+    bits = np.repeat(f_bits, degree)[order]
+    keys, starts, counts = np.unique(group_key[order], return_index=True, return_counts=True)
+    g_node = keys // words
+    g_word = keys % words
+    seen = known[g_node, g_word]
+    fresh = np.zeros(len(keys), dtype=np.uint64)
+    next_bits = np.zeros(len(keys), dtype=np.uint64)
+    for rank in range(int(counts.max()) if len(counts) else 0):
+        live = np.flatnonzero(counts > rank)
+        pos = starts[live] + rank
+        batch = bits[pos] & ~(seen[live] | fresh[live])
+        fresh[live] |= batch
+        if forward is None:
+            next_bits[live] |= batch
+        else:
+            keep = forward[edges[pos]]
+            next_bits[live[keep]] |= batch[keep]
+    sending = next_bits != 0
+    return (g_node, g_word), fresh, g_node[sending], g_word[sending], next_bits[sending]
+
+
+def run_batches(topology, forward=None, metrics=None, sparse_fill=0.0625):
+    """
+    Perform an all-to-all broadcast with one message batch per transmission
+
+    Every node keeps the set of known messages and the set it sends in the
+    current round as bitmasks over the origins. A transmission from u to v
+    carries the whole sending set of u; the receiver takes the new messages
+    with a difference and adds them to its known set with a union.
+    The first sender in graph.nodes() order keeps a message, as in the
+    receive_buffer.
+    The sending sets are kept as entries of their nonzero 64 bit words.
+    While they fill at least sparse_fill of the rows of the sending nodes,
+    a round moves whole rows (dense_batch_round); when only a few words
+    are in flight -- on a long path a node forwards about two messages per
+    round out of thousands -- it only moves those (sparse_batch_round).
+    The transmissions are counted per message like Node.send_to_neighbor.
+
+    Arguments:
+    topology -- Topology instance
+    forward -- result of half_sba_table for the half-SBA,
+               None -> pure flooding (every new message is forwarded)
+    metrics -- Metrics.MetricsStore; if given, it is reset and the round of
+               every first receipt is recorded in its first_receipt matrix (by node ID)
+    sparse_fill -- share of nonzero words below which a round goes word by word
+
+    Return-type:
+    sends -- number of transmitting events per node
+    senders -- bool array with the retransmitting nodes
+    rounds -- number of iterations until every node knows every message
+    """
+    size = topology.size
+    known = own_masks(size)
+    words = known.shape[1]
+    reverse_forward = None if forward is None else forward[reverse_edges(topology)]
+    front = message_masks(size)
+    # the sending sets, one entry per nonzero word sorted by node; at first the own messages
+    f_node = np.arange(size)
+    f_word = f_node // 64
+    f_bits = known[f_node, f_word]
+    sends = np.zeros(size, dtype=np.int64)
+    senders = np.zeros(size, dtype=bool)
+    # planes[b]: bit b of the round of the first receipt, see receipt_rounds
+    planes = []
+    rounds = 0
+    while len(f_node):
+        # a node sends its own message to any neighbor,
+        # a foreign one only if there is a neighbor besides the one it came from
+        degree = topology.degree[f_node]
+        own = np.where(f_word == f_node // 64,
+                       np.uint64(1) << (f_node % 64).astype(np.uint64), np.uint64(0))
+        outgoing = np.where(degree > 1, f_bits, f_bits & own)
+        outgoing[degree == 0] = 0
+        sends += np.bincount(f_node, popcount(outgoing[:, None]), size).astype(np.int64)
+        senders[f_node[(outgoing & ~own) != 0]] = True
+        active = np.count_nonzero(np.diff(f_node)) + 1
+        if len(f_node) < sparse_fill * active * words:
+            learned, fresh, f_node, f_word, f_bits = sparse_batch_round(
+                topology, known, f_node, f_word, f_bits, forward)
+        else:
+            learned, fresh, f_node, f_word, f_bits = dense_batch_round(
+                topology, known, front, f_node, f_word, f_bits, reverse_forward)
+        if not np.count_nonzero(fresh):
+            break
+        rounds += 1
+        known[learned] |= fresh
+        if metrics is not None:
+            for b in range(rounds.bit_length()):
+                if b == len(planes):
+                    planes.append(message_masks(size))
+                if rounds >> b & 1:
+                    planes[b][learned] |= fresh
+    if metrics is not None:
+        ids = np.array([node.ID for node in topology.nodes], dtype=np.int64)
+        # the store holds the first receipts of this run only, no counters
+        metrics.reset()
+        metrics.receipts()[ids[:, None], ids[None, :]] = receipt_rounds(planes, known, size)
+    return sends, senders, rounds
+
+
+def sba_cover_masks(topology):
+    """
+    Compile the cover-set information of the SBA into bitmasks
+
+    For every receiving node v the neighbors are numbered by their position
+    in the neighbor list of v. A message arriving over the edge s -> v covers
+    s itself and the neighbors of s.
+
+    Arguments:
+    topology -- Topology instance
+
+    Return-type:
+    edge_cover -- uint64 array (edges, words); bits of N(v) covered by the sender
+    full_mask -- uint64 array (nodes, words); bits of all the neighbors of v
+    """
+    words = max(1, int(np.ceil(topology.degree.max() / 64.))) if topology.size else 1
+    full_mask = np.zeros((topology.size, words), dtype=np.uint64)
+    edge_cover = np.zeros((len(topology.indices), words), dtype=np.uint64)
+    neigh_sets = [set(topology.neighbors(i).tolist()) for i in range(topology.size)]
+    sources = topology.edge_sources()
+    for v in range(topology.size):
+        for bit in range(topology.degree[v]):
+            full_mask[v, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    for e in range(len(topology.indices)):
+        sender = sources[e]
+        receiver = topology.indices[e]
+        for bit, neigh in enumerate(topology.neighbors(receiver)):
+            if neigh == sender or neigh in neigh_sets[sender]:
+                edge_cover[e, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    return edge_cover, full_mask
+
+
+def sba_timer_bounds(topology, timer_para):
+    """
+    Return the upper bound of the random timer for every node
+
+    Same computation as sba.get_random_timer, the timer is drawn
+    uniformly from [0, bound].
+    """
+    bounds = np.zeros(topology.size, dtype=np.int64)
+    for v in range(topology.size):
+        neigh = topology.neighbors(v)
+        degree_neigh = int(topology.degree[neigh].max()) if len(neigh) else 0
+        T_0 = float(1 + degree_neigh) / (1 + int(topology.degree[v]))
+        T_0 = 1 / T_0
+        bounds[v] = int(np.ceil(T_0 * timer_para))
+    return bounds
+
+
+def run_sba_seeds(topology, timer_para, seeds, rounds=100):
+    """
+    Perform the all-to-all broadcast of the SBA for several timer realizations
+
+    Every seed is an independent run on the same topology. The state is kept
+    in arrays with a leading seed dimension:
+    known -- bool (seeds, nodes, origins); message is in the data_stack
+    pending -- sorted flat keys of the vertex-message pairs with an active
+               random timer, with their expiry iteration and cover-set bits
+    Each iteration first handles the copies sent in the last iteration,
+    then checks the expired timers and finally sends, like setup_sending_SBA.
+    The loop stops early once no timer is active and nothing is sent,
+    since the counters cannot change anymore.
+
+    Arguments:
+    topology -- Topology instance
+    timer_para -- design parameter of the random timer
+    seeds -- list of integer seeds, one numpy RandomState per seed
+    rounds -- number of iterations of the SBA (default = 100)
+
+    Return-type:
+    messages -- int array; total number of sent messages per seed
+    max_load -- int array; max load of any node per seed
+    rebroadcaster -- int array; number of retransmitting nodes per seed
+    completion -- int array; first iteration in which every node knew every
+                  message, -1 if that never happened
+    """
+    size = topology.size
+    num = len(seeds)
+    rngs = [np.random.RandomState(seed) for seed in seeds]
+    edge_cover, full_mask = sba_cover_masks(topology)
+    bounds = sba_timer_bounds(topology, timer_para)
+    covered = np.all(edge_cover == full_mask[topology.indices], axis=1)
+    sources = topology.edge_sources()
+    words = full_mask.shape[1]
+    block = size * size
+
+    known = np.zeros((num, size, size), dtype=bool)
+    known[:, np.arange(size), np.arange(size)] = True
+    p_keys = np.zeros(0, dtype=np.int64)
+    p_expiry = np.zeros(0, dtype=np.int64)
+    p_cover = np.zeros((0, words), dtype=np.uint64)
+    completion = -np.ones(num, dtype=np.int64)
+    if size <= 1:
+        completion[:] = 0
+
+    # the initial messages are sent in the first iteration
+    send_seed = np.repeat(np.arange(num), size)
+    send_node = np.tile(np.arange(size), num)
+    send_origin = send_node.copy()
+    sent_seed, sent_node, sent_origin = [], [], []
+    arrivals = None
+    for iteration in range(rounds):
+        if arrivals is not None:
+            a_seed, a_node, a_origin, a_edge = arrivals
+            a_keys = (a_seed * size + a_node) * size + a_origin
+            # copies of messages with an active timer update the cover-set
+            if len(p_keys):
+                pos = np.searchsorted(p_keys, a_keys)
+                pos[pos == len(p_keys)] = 0
+                hit = p_keys[pos] == a_keys
+                np.bitwise_or.at(p_cover, pos[hit], edge_cover[a_edge[hit]])
+            fresh = ~known[a_seed, a_node, a_origin]
+            if fresh.any():
+                f_keys, f_edge = a_keys[fresh], a_edge[fresh]
+                # order the copies like the receive_buffer: first sender first
+                order = np.lexsort((sources[f_edge], f_keys))
+                f_keys, f_edge = f_keys[order], f_edge[order]
+                new_keys, first = np.unique(f_keys, return_index=True)
+                group_cover = np.bitwise_or.reduceat(edge_cover[f_edge], first, axis=0)
+                n_seed = new_keys // block
+                n_node = (new_keys // size) % size
+                known[n_seed, n_node, new_keys % size] = True
+                # activate a timer if the first sender does not cover the neighborhood
+                timed = ~covered[f_edge[first]]
+                new_keys, n_seed, n_node = new_keys[timed], n_seed[timed], n_node[timed]
+                group_cover = group_cover[timed]
+                timers = np.zeros(len(new_keys), dtype=np.int64)
+                for k in np.unique(n_seed):
+                    sel = n_seed == k
+                    # uniform integer in [0, bound] for every pair
+                    draw = rngs[k].random_sample(sel.sum())
+                    timers[sel] = np.floor(draw * (bounds[n_node[sel]] + 1)).astype(np.int64)
+                p_keys = np.concatenate((p_keys, new_keys))
+                p_expiry = np.concatenate((p_expiry, iteration + timers + 1))
+                p_cover = np.concatenate((p_cover, group_cover))
+                order = np.argsort(p_keys, kind='mergesort')
+                p_keys, p_expiry, p_cover = p_keys[order], p_expiry[order], p_cover[order]
+            done = completion < 0
+            if done.any():
+                complete = known.reshape(num, -1).all(axis=1) & done
+                completion[complete] = iteration
+        # expired timers -> rebroadcast if the cover-set misses a neighbor
+        if iteration > 0:
+            expired = p_expiry == iteration
+            e_keys = p_keys[expired]
+            e_node = (e_keys // size) % size
+            uncovered = np.any(p_cover[expired] != full_mask[e_node], axis=1)
+            e_keys = e_keys[uncovered]
+            send_seed = e_keys // block
+            send_node = (e_keys // size) % size
+            send_origin = e_keys % size
+            keep = ~expired
+            p_keys, p_expiry, p_cover = p_keys[keep], p_expiry[keep], p_cover[keep]
+        sent_seed.append(send_seed)
+        sent_node.append(send_node)
+        sent_origin.append(send_origin)
+        if not len(send_node) and not len(p_keys):
+            break
+        edges = topology.edge_range(send_node)
+        lens = topology.degree[send_node]
+        arrivals = (np.repeat(send_seed, lens), topology.indices[edges],
+                    np.repeat(send_origin, lens), edges)
+
+    sent_seed = np.concatenate(sent_seed)
+    sent_node = np.concatenate(sent_node)
+    sent_origin = np.concatenate(sent_origin)
+    messages = np.zeros(num, dtype=np.int64)
+    max_load = np.zeros(num, dtype=np.int64)
+    rebroadcaster = np.zeros(num, dtype=np.int64)
+    for k in range(num):
+        sel = sent_seed == k
+        sends, senders = count_forwards(topology, sent_origin[sel], sent_node[sel])
+        messages[k], max_load[k], rebroadcaster[k] = summarize(sends, senders)
+    return messages, max_load, rebroadcaster, completion
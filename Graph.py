@@ -2,136 +2,314 @@
 File contains all kind of functions related to output or graphical implementations.
 
 Animated Barplot:
-Class PlotBars -> Bar-agents for an animated Barplot.
-animate function -> argument for the matplotlib.animation
-bar_plot -> create the whole animated barplot
+bar_background -> the plot without bars, rendered once per node
+render_bar_animation -> paint the bars of every round into raster frames
+                        and pipe them into ffmpeg
+export_animations -> the animations of many nodes in parallel worker processes
+bar_plot -> the animation of a single node
 
 Iteration-plots:
 Shows in which iteration step a node gets messges
 from the other nodes in the network.
+Both read the first-receipt matrix of the metrics store (graph.graph['metrics']).
+Besides one bar plot per node, iteration_plots draws the whole matrix
+as heatmap or histograms in a single Agg figure, which also works for
+thousands of nodes.
 
 """
-# TODO find an appropriate way to save the animated plots
-
+import multiprocessing
+import os
+import subprocess as sp
+from distutils.spawn import find_executable
 import matplotlib.pyplot as plt
 import numpy as np
-import matplotlib.animation as animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import networkx as nx
 import math
 import itertools as it
 import Main as mn
 
 
-class PlotBars(object):
-    """A plotbar object stands for a node to be plotted"""
-    def __init__(self, bars):
-        """Bars is a rectangle object form matplotlib"""
-        self._bar = bars
+# encoder of the animations; the frames are piped into it as raw RGB images
+FFMPEG = 'ffmpeg'
+# color of the bars, the first color of the matplotlib cycle
+BAR_COLOR = (31, 119, 180)
 
-    def set_width(self, width):
-        """Change the length of a bar in the plot"""
-        self._bar.set_width(width)
 
-    def get_width(self):
-        """Return the length of the Rectangle object"""
-        return self._bar.get_width()
+def encoder_command(filename, width, height, fps):
+    """Command line of ffmpeg reading raw RGB frames from stdin and writing an mp4"""
+    return [FFMPEG, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{0}x{1}'.format(width, height),
+            '-r', str(fps), '-i', '-',
+            '-an', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', filename]
 
 
-def animate(frame, mybars, widthHist):
-    """perform animation step
+def bar_background(node_num, size, figsize=(8, 6), dpi=100):
+    """
+    Render the empty bar plot of a node once
 
+    Return-type:
+    frame -- uint8 array (height, width, 3) with axes, ticks and title
+    boxes -- int array (size, 4); row_start, row_stop, col_start, col_stop
+             of the full bar of every origin in the frame
+    """
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    y_pos = np.arange(size) + 0.5
+    if size <= 40:
+        # contains the names for the yticks
+        ax.set_yticks(y_pos)
+        ax.set_yticklabels(["node_" + str(i + 1) for i in range(size)])
+    ax.set_xlabel('Value')
+    ax.set_title('Packets in the data_stack of node_' + str(node_num))
+    ax.set_xlim(0, size)
+    ax.set_ylim(0, size)
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    frame = np.frombuffer(canvas.tostring_rgb(), dtype=np.uint8).reshape(height, width, 3).copy()
+    # the bar of origin j has the value j + 1 and is 0.4 high, in display coordinates
+    lower = ax.transData.transform(np.column_stack((np.zeros(size), y_pos - 0.2)))
+    upper = ax.transData.transform(np.column_stack((np.arange(size) + 1., y_pos + 0.2)))
+    boxes = np.empty((size, 4), dtype=np.int64)
+    # the rows of the image count from the top
+    boxes[:, 0] = np.floor(height - upper[:, 1])
+    boxes[:, 1] = np.maximum(np.ceil(height - lower[:, 1]), boxes[:, 0] + 1)
+    boxes[:, 2] = np.floor(lower[:, 0])
+    boxes[:, 3] = np.maximum(np.ceil(upper[:, 0]), boxes[:, 2] + 1)
+    return frame, boxes
+
+
+def render_bar_animation(task):
+    """
+    Write the animation of one node into its encoder
+
+    The background is rendered once; a bar appears in the frame of the
+    round in which the message arrived and stays, thus every frame only
+    paints the new bars into the last one and is piped to the encoder.
 
     Arguments:
-    Frame -- Number of total frames the resulting animation will have
-    mybars -- rectanvle objects
-    widthHist -- Matrix containing the iteration when the message was received
+    task -- tuple (node_num, receipts, filename, fps, encoder):
+            receipts -- first-receipt rounds of the node per origin, -1 -> never
+            encoder -- function returning the command line, see encoder_command
 
     Return-type:
-    None
+    filename -- the written file
     """
-    for i in range(len(mybars)):
-        mybars[i].set_width(widthHist[i, frame])
-        #time.sleep(0.15)
+    node_num, receipts, filename, fps, encoder = task
+    frame, boxes = bar_background(node_num, len(receipts))
+    height, width = frame.shape[:2]
+    process = sp.Popen(encoder(filename, width, height, fps), stdin=sp.PIPE)
+    order = np.argsort(receipts, kind='mergesort')
+    ends = np.searchsorted(receipts[order], np.arange(receipts.max() + 1), side='right')
+    begin = np.searchsorted(receipts[order], 0)
+    for end in ends:
+        for origin in order[begin:end]:
+            row0, row1, col0, col1 = boxes[origin]
+            frame[row0:row1, col0:col1] = BAR_COLOR
+        begin = end
+        process.stdin.write(frame.tostring())
+    process.stdin.close()
+    if process.wait():
+        raise RuntimeError('encoding {0} failed'.format(filename))
+    return filename
+
+
+def bar_animation_tasks(graph, node_nums, directory, fps, encoder):
+    """Tasks of render_bar_animation for the nodes named in node_nums"""
+    first_receipt = graph.graph['metrics'].first_receipt
+    nodes_names = nx.get_node_attributes(graph, "name")
+    names_nodes = dict(zip(nodes_names.values(), nodes_names.keys()))
+    tasks = []
+    for node_num in node_nums:
+        receipts = first_receipt[names_nodes[str(node_num)].ID]
+        filename = os.path.join(directory, 'node_' + str(node_num) + '.mp4')
+        tasks.append((node_num, receipts, filename, fps, encoder))
+    return tasks
 
 
-def bar_plot(graph, node_num, fig):
+def export_animations(graph, node_nums=None, directory='.', fps=0.5, processes=None,
+                      encoder=encoder_command):
+    """
+    Create the bar plot animations of many nodes at once
+
+    The frames come from the first-receipt matrix, every node is encoded
+    by its own worker process (see render_bar_animation).
+
+    Arguments:
+    graph -- networkx Graph after a broadcast
+    node_nums -- names (1, 2, ...) of the animated nodes (default = all)
+    directory -- directory of the node_<num>.mp4 files
+    fps -- frames (rounds) per second
+    processes -- number of worker processes (default = number of cpus), 1 -> no pool
+    encoder -- function returning the command line of the encoder
+
+    Return-type:
+    filenames -- list of the written files
+    """
+    if encoder is encoder_command and find_executable(FFMPEG) is None:
+        raise RuntimeError('{0} not found, it is needed to encode the animations'.format(FFMPEG))
+    if node_nums is None:
+        node_nums = range(1, graph.number_of_nodes() + 1)
+    tasks = bar_animation_tasks(graph, node_nums, directory, fps, encoder)
+    if processes == 1 or len(tasks) <= 1:
+        return [render_bar_animation(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(render_bar_animation, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def bar_plot(graph, node_num, directory='.', fps=0.5):
     """Create the animation to visualize the transmission
 
     Arguments:
     graph -- networkx Graph; contains whole topolgy information
-    fig -- matplotlib Figure; will hold the animation
+    node_num -- name of the node (1, 2, ...)
+    directory -- directory of the mp4 file
+    fps -- frames (rounds) per second
 
     Return-type:
-    Show the animation and stores it as mp4 file
-
-    """
-    # contains the names for the yticks
-    nodes = ["node_" + str(i + 1) for i in range(graph.number_of_nodes())]
-    y_pos = np.arange(len(nodes)) + 0.5
-    #fig = plt.figure(1)
-    # this blocks calculates the length of the bars in the plot
-    size = graph.number_of_nodes()
-    x_values = [0 for i in range(size)]
-    # setup the plot
-    bars = plt.barh(y_pos, x_values, 0.4, align='center')
-    # bars is a list with rectangle objects
-    mybars = [PlotBars(bars[i]) for i in range(size)]
-    plt.yticks(y_pos, nodes)
-    plt.xlabel('Value')
-    plt.title('Packets in the data_stack of node_' + str(node_num))
-    plt.xlim(0, size)
-    plt.ylim(0, size)
-    nodes_names = nx.get_node_attributes(graph, "name")
-    names_nodes = dict(zip(nodes_names.values(), nodes_names.keys()))
-    width_hist = names_nodes[str(node_num)].packet_history
-
-    ani = animation.FuncAnimation(fig, animate, len(width_hist[:, 0]),
-                                  fargs=(mybars, width_hist),
-                                  interval=2000, blit=False, repeat=False)
-    ani.save('node_' + str(node_num) + '.mp4', codec=ffmpeg)
-             # extra_args=['-vcodec', 'libx264'])
-    # plt.show()
+    filename -- the animation stored as node_<node_num>.mp4
+    """
+    return export_animations(graph, [node_num], directory, fps, processes=1)[0]
 
 
-def iteration_plots(graph):
+def iteration_plots(graph, mode='bars', filename=None, max_pixels=1000):
     """Create a barplot indicating when a message was received
 
-    With the message history in every node create a barplot showing for each node
+    With the first-receipt matrix create a barplot showing for each node
     in which iteration it received the message from the other nodes.
     Then save the plot in the same directory as the Main.py file
-    as 'iteration.png'
+    as 'iteration.svg'
+
+    For big graphs use another mode, which draws a single figure:
+    'heatmap' -- node x origin matrix colored by the first receipt,
+                 see iteration_heatmap
+    'histogram' -- messages learned per iteration and nodes done per iteration,
+                   see iteration_histogram
+
+    Arguments:
+    graph -- networkx Graph after a broadcast
+    mode -- 'bars', 'heatmap' or 'histogram'
+    filename -- name of the saved figure
+                (default = 'iteration.svg' or 'iteration_<mode>.png')
+    max_pixels -- the heatmap is reduced to at most max_pixels blocks per axis
     """
+    first_receipt = graph.graph['metrics'].first_receipt
+    if mode == 'heatmap':
+        return iteration_heatmap(first_receipt, filename or 'iteration_heatmap.png', max_pixels)
+    if mode == 'histogram':
+        return iteration_histogram(first_receipt, filename or 'iteration_histogram.png')
     size = len(graph.nodes())
     rows = int(math.ceil(size / 2.))
     cols = 2
     nodes = [str(i + 1) for i in range(size)]
-    y_pos = [i + 0.5 for i in range(size)]
+    y_pos = np.arange(size) + 0.5
     nodes_names = nx.get_node_attributes(graph, "name")
     names_nodes = dict(zip(nodes_names.values(), nodes_names.keys()))
 
     fig, axarr = plt.subplots(rows, cols, sharex='col', sharey='row')
     fig.text(0.5, 0.05, 'iteration', ha='center', va='center')
     fig.text(0.05, 0.5, 'neighbor', ha='center', va='center', rotation='vertical')
-    x_lim = len(graph.nodes()[0].packet_history[0])
+    x_lim = first_receipt.max() + 1
     for row in range(rows):
         for col in range(cols):
             node_num = row * cols + col + 1
             if node_num - 1 >= size:
                 break
-            matrix = names_nodes[str(node_num)].packet_history
-            # this line finds the index of the first nonzero value in the 1-D
-            # ndarray.
-            # could speed this up by writing a cpython function
-            x_values = [np.nonzero(matrix[i])[0][0] for i in range(size)]
+            # row of the node: round of the first receipt of every origin
+            x_values = first_receipt[names_nodes[str(node_num)].ID]
+            # messages which never arrived (-1) get no bar
+            known = x_values >= 0
             # this block prints all the subplots and sets the ylabels
             axarr[row, col].set_title('node' + str(node_num))
             axarr[row, col].set_yticks(y_pos)
             axarr[row, col].set_yticklabels(nodes)
             axarr[row, col].set_ylim(0, size)
             axarr[row, col].set_xlim(0, x_lim)
-            axarr[row, col].barh(y_pos, x_values, 0.4, align='center')
+            axarr[row, col].barh(y_pos[known], x_values[known], 0.4, align='center')
+
+    fig.savefig(filename or "iteration.svg")
 
-    fig.savefig("iteration.svg")
+
+def block_means(matrix, max_pixels):
+    """
+    Reduce the first-receipt matrix to at most max_pixels blocks per axis
+
+    Every block gets the mean of its known entries (>= 0), NaN if there is none.
+    """
+    size = matrix.shape[0]
+    block = max(1, int(math.ceil(size / float(max_pixels))))
+    blocks = int(math.ceil(size / float(block)))
+    known = matrix >= 0
+    padded = np.zeros((blocks * block, blocks * block), dtype=np.int64)
+    padded[:size, :size] = np.where(known, matrix, 0)
+    sums = padded.reshape(blocks, block, blocks, block).sum(axis=3).sum(axis=1)
+    padded[:] = 0
+    padded[:size, :size] = known
+    counts = padded.reshape(blocks, block, blocks, block).sum(axis=3).sum(axis=1)
+    means = sums / np.maximum(counts, 1).astype(float)
+    means[counts == 0] = np.nan
+    return means, block
+
+
+def iteration_heatmap(first_receipt, filename, max_pixels=1000):
+    """
+    Draw the first-receipt matrix as heatmap and save it
+
+    Rows are the receiving nodes, columns the origins of the messages;
+    messages which never arrived stay white. Big matrices are reduced
+    to blocks, see block_means. Drawn on an Agg canvas without pyplot.
+    """
+    size = first_receipt.shape[0]
+    means, block = block_means(first_receipt, max_pixels)
+    fig = Figure(figsize=(9, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    image = ax.imshow(np.ma.masked_invalid(means), aspect='auto', interpolation='nearest',
+                      origin='lower', extent=(0.5, size + 0.5, 0.5, size + 0.5))
+    colorbar = fig.colorbar(image, ax=ax)
+    colorbar.set_label('iteration of the first receipt')
+    ax.set_xlabel('origin')
+    ax.set_ylabel('node')
+    title = 'First receipts, {0} nodes'.format(size)
+    if block > 1:
+        title += ' (means of {0}x{0} blocks)'.format(block)
+    ax.set_title(title)
+    fig.savefig(filename)
+    return fig
+
+
+def iteration_histogram(first_receipt, filename):
+    """
+    Draw histograms of the first-receipt matrix and save them
+
+    Upper plot: number of messages learned in every iteration (all nodes),
+    lower plot: number of nodes which learned their last message in that iteration.
+    Drawn on an Agg canvas without pyplot.
+    """
+    size = first_receipt.shape[0]
+    foreign = first_receipt[~np.eye(size, dtype=bool)]
+    learned = np.bincount(foreign[foreign >= 0])
+    complete = ~(first_receipt < 0).any(axis=1)
+    done = np.bincount(first_receipt.max(axis=1)[complete], minlength=len(learned))
+    fig = Figure(figsize=(9, 8))
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot(2, 1, 1)
+    ax1.bar(np.arange(len(learned)), learned, 1.0, color='blue')
+    ax1.set_ylabel('messages learned')
+    missing = len(foreign) - learned.sum()
+    ax1.set_title('First receipts, {0} nodes, {1} messages never arrived'.format(size, missing))
+    ax2 = fig.add_subplot(2, 1, 2, sharex=ax1)
+    ax2.bar(np.arange(len(done)), done, 1.0, color='orange')
+    ax2.set_ylabel('nodes done')
+    ax2.set_xlabel('iteration')
+    fig.savefig(filename)
+    return fig
 
 
 def print_graph(graph):
@@ -0,0 +1,170 @@
+"""
+This file contains all functions related to the hello protocol.
+Instead of reading the neighborhood out of the master graph (Node.build_2_hop)
+the nodes broadcast hello messages over their links and build their
+two_hop_dict out of the received ones. After a node advertised its whole
+neighbor list once, it only sends the changes.
+Note that since it does not inherit from the Node Class, the considered node
+is always passed as an argument -> calling_node
+"""
+import Package as pac
+
+
+def reset_neighborhood(graph):
+    """Forget all the neighbor information gathered by hellos"""
+    for node in graph.nodes():
+        node.two_hop_dict = {}
+        node.local_two_hop = None
+        node.neigh_lists = {}
+        node.two_hop_via = {}
+        node.advertised = None
+        node.hello_synced = set()
+        node.hello_pending = False
+        node.hello_buffer = []
+
+
+def refresh_entry(calling_node, neigh):
+    """
+    Recompute the 2-hop list of one 1-hop neighbor
+
+    The 2-hop list contains the advertised neighbors of neigh which are
+    neither the calling_node itself nor one of its 1-hop neighbors.
+    """
+    calling_node.two_hop_dict[neigh] = [
+        node for node in calling_node.neigh_lists.get(neigh, [])
+        if node is not calling_node and node not in calling_node.two_hop_dict]
+    calling_node.local_two_hop = None
+
+
+def add_neighbor(calling_node, neigh):
+    """Insert a new 1-hop neighbor and drop it from the 2-hop lists"""
+    calling_node.two_hop_dict[neigh] = []
+    for node in calling_node.two_hop_via.get(neigh, ()):
+        if node in calling_node.two_hop_dict:
+            refresh_entry(calling_node, node)
+    refresh_entry(calling_node, neigh)
+
+
+def remove_neighbor(calling_node, neigh):
+    """Delete a lost 1-hop neighbor; it may still be a 2-hop neighbor"""
+    if neigh not in calling_node.two_hop_dict:
+        return None
+    del calling_node.two_hop_dict[neigh]
+    for node in calling_node.neigh_lists.pop(neigh, []):
+        calling_node.two_hop_via[node].discard(neigh)
+    calling_node.hello_synced.discard(neigh)
+    for node in calling_node.two_hop_via.get(neigh, ()):
+        if node in calling_node.two_hop_dict:
+            refresh_entry(calling_node, node)
+    calling_node.local_two_hop = None
+
+
+def link_down(node_1, node_2):
+    """Link layer notification: the link between both nodes broke"""
+    for node, neigh in ((node_1, node_2), (node_2, node_1)):
+        remove_neighbor(node, neigh)
+        node.hello_pending = True
+
+
+def link_up(node_1, node_2):
+    """Link layer notification: a new link came up -> both have to send a hello"""
+    node_1.hello_pending = True
+    node_2.hello_pending = True
+
+
+def send_hello(calling_node, graph):
+    """
+    Broadcast a hello to all physical neighbors if there is something new
+
+    The first hello and every hello reaching a neighbor which does not know
+    the whole neighbor list yet are full, all others only contain the changes.
+    Hellos are counted in their own metrics column, apart from the data messages.
+
+    Return-type:
+    True -- if a hello was sent
+    False -- if nothing changed
+    """
+    current = list(calling_node.two_hop_dict)
+    if calling_node.advertised is not None:
+        added = [node for node in current if node not in calling_node.advertised]
+        removed = [node for node in calling_node.advertised
+                   if node not in calling_node.two_hop_dict]
+        if not added and not removed and not calling_node.hello_pending:
+            return False
+    full = (calling_node.advertised is None or
+            any(node not in calling_node.hello_synced for node in current))
+    if full:
+        hello = pac.Hello(calling_node, calling_node.hello_seq, True, current)
+    else:
+        hello = pac.Hello(calling_node, calling_node.hello_seq, False, added, removed)
+    calling_node.hello_seq += 1
+    for neigh in graph.neighbors(calling_node):
+        neigh.hello_buffer.append(hello)
+    calling_node.metrics.record_hello(calling_node.ID)
+    calling_node.advertised = set(current)
+    calling_node.hello_synced = set(current)
+    calling_node.hello_pending = False
+    return True
+
+
+def check_hello_buffer(calling_node):
+    """
+    Update the neighborhood with the received hellos
+
+    An unknown sender becomes a 1-hop neighbor. Only the 2-hop lists touched
+    by a hello are recomputed.
+    """
+    for hello in calling_node.hello_buffer:
+        sender = hello.sender
+        if sender not in calling_node.two_hop_dict:
+            add_neighbor(calling_node, sender)
+        old_lst = calling_node.neigh_lists.get(sender, [])
+        if hello.full:
+            new_lst = list(hello.added)
+        else:
+            removed = set(hello.removed)
+            new_lst = [node for node in old_lst if node not in removed]
+            new_lst += [node for node in hello.added if node not in new_lst]
+        for node in old_lst:
+            calling_node.two_hop_via[node].discard(sender)
+        for node in new_lst:
+            calling_node.two_hop_via.setdefault(node, set()).add(sender)
+        calling_node.neigh_lists[sender] = new_lst
+        refresh_entry(calling_node, sender)
+    calling_node.hello_buffer = []
+
+
+def hello_round(graph):
+    """
+    Perform one round of the hello protocol
+
+    Return-type:
+    sent -- number of hellos sent in this round
+    """
+    sent = 0
+    for node in graph.nodes():
+        if send_hello(node, graph):
+            sent += 1
+    for node in graph.nodes():
+        check_hello_buffer(node)
+    return sent
+
+
+def discover(graph, max_rounds=100):
+    """
+    Run hello rounds until no node has anything new to tell
+
+    From scratch this takes two rounds with hellos: the first one tells the
+    neighbors who is there, the second one the neighbor lists.
+
+    Arguments:
+    graph -- networkx.Graph with Node instances
+    max_rounds -- upper limit of the rounds
+
+    Return-type:
+    rounds -- number of rounds in which hellos were sent
+    """
+    rounds = 0
+    while rounds < max_rounds and hello_round(graph):
+        rounds += 1
+    return rounds
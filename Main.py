@@ -9,200 +9,102 @@ import Graph
 import NodeClass as nde
 import SBAClass as sba
 import AHBPClass as ahbp
+import FastBroadcast as fast
+import RandomStreams as rs
+import BroadcastProtocol as bp
+import Profiler as prof
+import ResultSink as sink
+import OnlineStats as ostats
+import Metrics as mtr
 import random
 import numpy as np
+import scipy.sparse as sp
 from collections import OrderedDict
 import itertools as it
 
 
-def check_nodes(graph):
-    """
-    Check if all nodes in the graph already got all messages
-
-    Note that the criterium for having all nodes is rather easy since we
-    initialize all nodes with only  one message at the beginning.
-    Thus at the end the data_stack has to contain 10 different messages.
-
-    Arguments:
-    graph -- networkx Graph object
-
-    Return-type:
-    True -- if all nodes contain all messages
-    False -- if not everything is known to all messages
-    """
-    size = len(graph)
-    for node in graph.nodes_iter():
-        if len(node.data_stack) == size:
-            pass
-        elif len(node.data_stack) < size:
-            return False
-    return True
-
-
-def get_message_counter(graph):
+def get_message_counter(graph, include_hello=True):
     """
     Compute the total number of sent messages in the network
 
-    Iterate through all the nodes in the network and add up their
-    message_counter to get the total number.
+    Read the totals out of the metrics store of the graph.
+    The hellos of the neighbor discovery count like data messages.
 
     Arguments:
     graph -- networkx Graph representing the network
+    include_hello -- False -> only the data messages
 
     Return-type:
     total_number -- total number of sent messages
+    max_number -- max load of any node without its own message
     """
-    total_number = 0
-    numbers = []
-    for node in graph.nodes():
-        # node_counter = 5*len(node.message_counter)
-        # numbers.append(node_counter)
-        node_counter = 0
-        for number in node.message_counter:
-            node_counter += number
-            total_number += number
-        numbers.append(node_counter)
-    # substract 5 because we don't want to count the own message
-    max_number = max(numbers) - 5
-    # delete comment for use later
-    return total_number, max_number
+    metrics = graph.graph['metrics']
+    return metrics.messages(include_hello), metrics.max_load(include_hello)
 
 
-def setup_sending_flooding(graph):
+def setup_sending_flooding(graph, network=None, profiler=None):
     """
     Perfrom the sending process according to pure flooding
 
-    Iterates through all nodes in the graph.
-    The sending part and message-updating part are split.
-    -> a message is not rebroadcasted mulitpletimes in the same iteration
+    Every node rebroadcasts every new message to all its neighbors.
+    The loop itself is BroadcastProtocol.run_broadcast.
 
     Arguments:
     graph -- a graph with node instances as vertices
-    iteration -- number of iteration done during the sending
-    FLAG -- string which indicates the broadcast algorithm
+    network -- DynamicTopology.DynamicNetwork changing the graph between rounds
+    profiler -- Profiler.PhaseProfiler recording the phases of the run
 
     Return-type:
     none
     """
-    flag = 'flooding'
-    # initate all nodes with a datapacket
-    for node in graph.nodes():
-        node.init_1_data()
-    # loop through all nodes and their neighbours and push data from
-    # its own sending_buffer to its neighbour's receive_buffer
-    iteration = 0
-    while not check_nodes(graph):
-        for node in graph.nodes():
-            # check if node rebroadcasts any messages
-            node.send_to_neighbor(graph.neighbors(node))
-        # before updating the sending_buffer delete already sent data
-        # after update del receive_buffer not to check already known data twice
-        for node in graph.nodes():
-            node.del_sending_buffer()
-            node.update_data(flag)
-            node.del_receive_buffer()
-        iteration += 1
-        #Graph.print_all_data_stacks(graph)
-    for node in graph.nodes():
-        node.send_to_neighbor(graph.neighbors(node))
+    bp.run_broadcast(graph, bp.Flooding(), network, profiler)
 
 
-def setup_sending_SBA(graph, timer):
+def setup_sending_SBA(graph, timer, hello=False, network=None, profiler=None):
     """
     Perform the sending process according to the SBA
 
-    Iterates through all nodes in the graph.
-    The sending part and message-updating part are split.
-    -> a message is not rebroadcasted mulitpletimes in the same iteration
     Message-updating:
     - Check vertex-message pairs with an active random timer
     - After sending check the receive-buffer for unknown messages
 
     Arguments:
     graph -- a graph with node instances as vertices
-    iteration -- number of iteration done during the sending
-    FLAG -- string which indicates the broadcast algorithm
+    timer -- design parameter of the random timer
+    hello -- if True the neighborhood is discovered by the hello protocol
+    network -- DynamicTopology.DynamicNetwork changing the graph between rounds
+    profiler -- Profiler.PhaseProfiler recording the phases of the run
 
     Return-type:
     none
     """
-    # initiate all nodes with a data packet
-    for node in graph.nodes():
-        node.init_1_data()
-        node.build_2_hop(graph)
-    # update each packet_dict, containing all the packets
-    # that currently have an active random timer
-    iteration = 0
-    for i in range(100):
-    # while not check_nodes(graph):
-        for node in graph.nodes():
-            sba.check_receive_buffer(node, iteration, timer)
-        for node in graph.nodes():
-            sba.update_packet_dict(node, iteration)
-        # forward packet in the sending list to neighbors
-        # print 'sending'
-        for node in graph.nodes():
-            node.send_to_neighbor(node.two_hop_dict.keys())
-            node.del_sending_buffer()
-
-        iteration += 1
-    for node in graph.nodes():
-        node.send_to_neighbor(graph.neighbors(node))
+    bp.run_broadcast(graph, bp.SBA(timer, hello), network, profiler)
 
 
-def setup_sending_AHBP(graph):
+def setup_sending_AHBP(graph, brg='batch', precompute=False, processes=None, hello=False,
+                       network=None, profiler=None):
     """
     Perfrom the sending process according to the AHBP
 
-    Iterates through all nodes in the graph.
-    The sending part and message-updating part are split.
-    -> a message is not rebroadcasted mulitpletimes in the same iteration
     Message-updating:Check the receive-buffer and if needed build the BRG-set
 
     Arguments:
     graph -- a graph with node instances as vertices
-    iteration -- number of iteration done during the sending
+    brg -- how the BRG-sets are built: 'batch' -> all messages of a node at once,
+           'single' -> message by message, 'graph' -> with networkx graphs
+    precompute -- precompute the BRG-sets of all nodes in a process pool
+    processes -- size of the process pool for the precomputation
+    hello -- if True the neighborhood is discovered by the hello protocol
+    network -- DynamicTopology.DynamicNetwork changing the graph between rounds
+    profiler -- Profiler.PhaseProfiler recording the phases of the run
 
     Return-type:
     none
     """
-    # initiate the nodes with a data packet
-    for node in graph.nodes_iter():
-        node.init_1_data()
-        # only use this until hello protocol is implemented
-        # this gets the 2-hop neighbor hood form the 'master'-graph
-        node.build_2_hop(graph)
-        # with open("node_" + str(node.ID + 1) + '.txt', 'w') as outfile:
-        #     outfile.write("new file for node :" + str(node.ID + 1) + "\n")
-
-    iteration = 0
-    while not check_nodes(graph):
-        # split up the process of checking the receive_buffer
-        # and sending to neighbor, such that can only traverse
-        # one edge during an iteration step
+    bp.run_broadcast(graph, bp.AHBP(brg, precompute, processes, hello), network, profiler)
 
-        for node in graph.nodes():
-            ahbp.check_receive_buffer(node, iteration)
-            node.del_receive_buffer()
-
-            # for all messages in the sending_buffer build the BRG-Set
-            for message in node.sending_buffer:
-                ahbp.build_BRG(node, message)
-
-        if check_nodes(graph):
-            break
 
-        # rebroadcast the messages in the sending_buffer to the neighbors
-        for node in graph.nodes_iter():
-            # check if node rebroadcasts any messages
-            node.send_to_neighbor(node.two_hop_dict.keys())
-            node.del_sending_buffer()
-        iteration += 1
-    for node in graph.nodes():
-        node.send_to_neighbor(graph.neighbors(node))
-
-
-def setup_sending_half_sba(graph):
+def setup_sending_half_sba(graph, hello=False, network=None, profiler=None):
     """
     Perform the sending process according to parts of the SBA
 
@@ -212,34 +114,113 @@ def setup_sending_half_sba(graph):
 
     Arguments:
     graph -- networkx.Graph instance; contains the whole network
+    hello -- if True the neighborhood is discovered by the hello protocol
+    network -- DynamicTopology.DynamicNetwork changing the graph between rounds
+    profiler -- Profiler.PhaseProfiler recording the phases of the run
 
     Return-type:
     None
     """
-    for node in graph.nodes():
-        node.init_1_data()
-        node.build_2_hop(graph)
+    bp.run_broadcast(graph, bp.HalfSBA(hello), network, profiler)
 
-    iteration = 0
-    while not check_nodes(graph):
-        for node in graph.nodes():
-            # check if node rebroadcasts any messages
-            node.send_to_neighbor(node.two_hop_dict.keys())
-            node.del_sending_buffer()
 
-        for node in graph.nodes_iter():
-            for message in node.receive_buffer:
-                boolean = node.check_data_stack(message)
-                if not boolean:
-                    message.add_to_path(node)
-                    node.data_stack.append(message)
-                    if not sba.check_neigh(node, message.last_node):
-                        node.sending_buffer.append(message)
+def setup_sending_half_sba_table(graph, topology=None):
+    """
+    Perform the half-SBA with a precompiled forwarding table
+
+    The forwarding decision of the half-SBA only depends on the edge a message
+    arrived on. Thus compile the topology once and traverse all broadcasts
+    on arrays without any Packet objects. Gives the same numbers as
+    setup_sending_half_sba followed by get_message_counter and get_num_sender.
+
+    Arguments:
+    graph -- networkx.Graph instance; contains the whole network
+    topology -- FastBroadcast.Topology of the graph (compiled if not given)
+
+    Return-type:
+    messages -- total number of sent messages
+    max_mes -- max load of any node
+    rebroadcaster -- number of retransmitting nodes
+    """
+    if topology is None:
+        topology = fast.Topology(graph)
+    sends, senders, rounds = fast.run_half_sba(topology)
+    return fast.summarize(sends, senders)
+
+
+def setup_sending_flooding_batches(graph, topology=None, receipts=False):
+    """
+    Perform pure flooding with message batches instead of Packet objects
+
+    A transmission carries the set of all messages a node sends in a round
+    as a bitmask, see FastBroadcast.run_batches. Gives the same numbers as
+    setup_sending_flooding followed by get_message_counter and get_num_sender.
+
+    Arguments:
+    graph -- networkx.Graph instance; contains the whole network
+    topology -- FastBroadcast.Topology of the graph (compiled if not given)
+    receipts -- if True the first receipts are recorded in the metrics store
+                of the graph, e.g. for Graph.iteration_plots
+
+    Return-type:
+    messages -- total number of sent messages
+    max_mes -- max load of any node
+    rebroadcaster -- number of retransmitting nodes
+    """
+    if topology is None:
+        topology = fast.Topology(graph)
+    metrics = graph.graph['metrics'] if receipts else None
+    sends, senders, rounds = fast.run_batches(topology, metrics=metrics)
+    return fast.summarize(sends, senders)
+
+
+def setup_sending_half_sba_batches(graph, topology=None, receipts=False):
+    """
+    Perform the half-SBA with message batches and the forwarding table
+
+    Same numbers as setup_sending_half_sba_table; faster on graphs with
+    a small diameter. On long line graphs only the few messages in flight
+    are moved, still it takes about twice as long as the table version there.
+
+    Arguments:
+    graph -- networkx.Graph instance; contains the whole network
+    topology -- FastBroadcast.Topology of the graph (compiled if not given)
+    receipts -- if True the first receipts are recorded in the metrics store
+                of the graph, e.g. for Graph.iteration_plots
+
+    Return-type:
+    messages -- total number of sent messages
+    max_mes -- max load of any node
+    rebroadcaster -- number of retransmitting nodes
+    """
+    if topology is None:
+        topology = fast.Topology(graph)
+    metrics = graph.graph['metrics'] if receipts else None
+    sends, senders, rounds = fast.run_batches(topology, fast.half_sba_table(topology), metrics)
+    return fast.summarize(sends, senders)
+
 
-            node.del_receive_buffer()
-        iteration += 1
-    for node in graph.nodes():
-        node.send_to_neighbor(graph.neighbors(node))
+def setup_sending_SBA_seeds(graph, timer, seeds, rounds=100):
+    """
+    Perform the SBA for many random timer realizations at once
+
+    Instead of rebuilding all Node states for every run, all the runs
+    on the same topology are simulated together on arrays.
+
+    Arguments:
+    graph -- networkx.Graph instance; contains the whole network
+    timer -- design parameter of the random timer
+    seeds -- list with one integer seed per run
+    rounds -- number of iterations of the SBA (default = 100)
+
+    Return-type:
+    messages -- numpy array; total number of sent messages per seed
+    max_mes -- numpy array; max load of any node per seed
+    rebroadcaster -- numpy array; number of retransmitting nodes per seed
+    completion -- numpy array; iteration in which all nodes knew all messages
+    """
+    topology = fast.Topology(graph)
+    return fast.run_sba_seeds(topology, timer, seeds, rounds)
 
 
 def setup_graph(laplacian):
@@ -247,7 +228,7 @@ def setup_graph(laplacian):
     Create a graph object with Node-instances according to the laplacian
 
     Arguments:
-    laplacian -- numpy.array with the laplacian matrix of the graph
+    laplacian -- numpy.array or scipy.sparse matrix with the laplacian of the graph
     iteration -- number of iteration for the sending-history (default = 0)
 
     Return-type:
@@ -256,34 +237,64 @@ def setup_graph(laplacian):
     nde.Node.obj_counter = 0
     # this block adds the nodes to the graph and creates two dict
     # in order to label the graph correctly
-    size = len(laplacian[0, :])
+    size = laplacian.shape[0]
     my_graph = nx.Graph()
     for i in range(size):
         # depending on the mode add the arguments in the node initiator
         my_graph.add_node(nde.Node(), name=str(i + 1), color='blue')
+    # counters of all the nodes, indexed by the node ID
+    my_graph.graph['metrics'] = mtr.MetricsStore(size)
+    for node in my_graph.nodes_iter():
+        node.metrics = my_graph.graph['metrics']
     # stores the nodes and their name attributes in a dictionary
     nodes_names = nx.get_node_attributes(my_graph, "name")
     # switches key and values--> thus names_nodes
     names_nodes = dict(zip(nodes_names.values(), nodes_names.keys()))
 
     # this block adds the edges between the nodes
-    for i in range(0, size):
-        for j in range(i + 1, size):
-            if laplacian[i, j] == -1:
-                node_1 = names_nodes[str(i + 1)]
-                node_2 = names_nodes[str(j + 1)]
-                my_graph.add_edge(node_1, node_2)
+    # in the same order as going through the upper triangle row by row
+    for i, j in laplacian_edges(laplacian):
+        node_1 = names_nodes[str(i + 1)]
+        node_2 = names_nodes[str(j + 1)]
+        my_graph.add_edge(node_1, node_2)
 
     return my_graph
 
 
+def laplacian_edges(laplacian):
+    """
+    Return the edges (i, j), i < j, of a laplacian sorted by i and then j
+
+    Arguments:
+    laplacian -- numpy.array or scipy.sparse matrix
+
+    Return-type:
+    edges -- numpy array of shape (number of edges, 2)
+    """
+    if sp.issparse(laplacian):
+        coo = laplacian.tocoo()
+        upper = (coo.row < coo.col) & (coo.data == -1)
+        rows, cols = coo.row[upper], coo.col[upper]
+        order = np.lexsort((cols, rows))
+        return np.column_stack((rows[order], cols[order]))
+    return np.argwhere(np.triu(np.asarray(laplacian) == -1, 1))
+
+
+def sparse_laplacian(graph):
+    """Laplacian of a networkx graph as scipy.sparse matrix in graph.nodes() order"""
+    index = dict((node, i) for i, node in enumerate(graph.nodes()))
+    size = len(index)
+    rows = [index[u] for u, v in graph.edges()]
+    cols = [index[v] for u, v in graph.edges()]
+    adjacency = sp.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(size, size))
+    adjacency = (adjacency + adjacency.T).tocsr()
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    return (sp.diags(degree, 0) - adjacency).tocsr()
+
+
 def get_num_sender(graph):
-    """Iterate through graph and count true sender flags"""
-    rebroadcaster = 0
-    for node in graph.nodes_iter():
-        if node.sender:
-            rebroadcaster += 1
-    return rebroadcaster
+    """Count the nodes which rebroadcast a foreign message"""
+    return graph.graph['metrics'].rebroadcasters()
 
 
 def average_degree(graph):
@@ -296,24 +307,33 @@ def average_degree(graph):
 
 
 def clear_graph_data(graph):
-    """Clear counter, flags and messages in the graph"""
+    """Clear counter, flags, messages and pending SBA timers in the graph"""
     for node in graph.nodes_iter():
         node.del_sending_buffer()
         node.del_receive_buffer()
         node.del_data_stack()
-        node.sender = False
-        node.message_counter = []
+        # an SBA stopped by its round limit may leave timers behind
+        node.packet_dict = {}
+        node.cover_dict = {}
+    graph.graph['metrics'].reset()
 
 
-def random_graph(num_nodes):
-    laplacian_array = build_rand_graph(num_nodes)
+def random_graph(num_nodes, rng=random):
+    laplacian_array = build_rand_graph(num_nodes, rng)
     rand_graph = setup_graph(laplacian_array)
     return rand_graph, laplacian_array
 
 
-def build_line_laplacian(size):
+def build_line_laplacian(size, sparse=False):
     """
-    Build laplacian of line-graph and return it as numpy.array"""
+    Build laplacian of line-graph and return it as numpy.array
+
+    With sparse=True it is returned as scipy.sparse matrix, for big sizes."""
+    if sparse:
+        degree = 2 * np.ones(size)
+        degree[0] = degree[-1] = 1
+        off = -np.ones(size - 1)
+        return sp.diags([off, degree, off], [-1, 0, 1], format='csr')
     my_ar = np.eye(size)
     if size == 2:
         my_ar = np.array([[1, -1],
@@ -342,6 +362,19 @@ def get_connectivity(laplacian):
     return val[1]
 
 
+def round_connectivity(conn, size):
+    """
+    Round the connectivity to the bin used in the plots
+
+    The bigger the graphs, the closer the connectivities -> more digits.
+    """
+    if size > 20:
+        return round(conn, 4)
+    elif size == 20:
+        return round(conn, 3)
+    return round(conn, 2)
+
+
 def test_connectivity():
     conn_dict = {}
     conn_lst = []
@@ -412,63 +445,19 @@ def sort_dict(raw_dict):
     return conn_lst, y_lst, y_error
 
 
-def average_std(value_dict):
-    """
-    Compute the average and std for the values of the input dictionary
-
-    Argument:
-    value_dict -- dictionary with key: connectivity; values: [ measured values ]
-
-    Return-type:
-    value_dict -- dictionary now with key: connectivity; values: [ average, std ]
-    """
-    for number in value_dict:
-        average = round(np.average(value_dict[number]), 0)
-        deviation = np.std(value_dict[number])
-        value_dict[number] = [average, deviation]
-    return value_dict
-
-
-def update_dict(mes_dict, rebroad_dict, max_dict, conn, rebroad, mes, max_mes):
-    """
-    Check if conn is already key and append rebroad, mes
-
-    Argument:
-    mes_dict -- dictionary containing the total number of messages
-    rebroad_dict -- dictionary conatining the number of rebroadcaster
-    conn -- connectivity of the graph
-    rebroad -- number of rebroadcaster measured for the sample
-    mes -- total messages measured for the sample
-
-    Return-type:
-    rebroad_dict -- updated rebroad_dict
-    mes_dict -- updated message_dict
-    max_dict -- updated max_dict
-    """
-    if conn not in mes_dict:
-        mes_dict[conn] = []
-    if conn not in rebroad_dict:
-        rebroad_dict[conn] = []
-    if conn not in max_dict:
-        max_dict[conn] = []
-
-    max_dict[conn].append(max_mes)
-    mes_dict[conn].append(mes)
-    rebroad_dict[conn].append(rebroad)
-    return rebroad_dict, mes_dict, max_dict
-
-
-def test_sba():
+def test_sba(size=6, band=(0.9, 1.1), samples=20, max_candidates=2000):
     """
     Test function to investigate certain graphs
 
-    Choose the graph size and the number of samples.
+    Choose the graph size, the band of the connectivity and the number of samples.
+    The graphs are drawn by TargetedGraphs.ConnectivityGenerator, which steers
+    the random graphs into the band instead of throwing away all others.
     Then let a certain broadcasting algorithm run over the graph.
     Print graph topologies with desired connectivities and later on
     print all the collected data from the samples
     """
-    size = 6
-    samples = 1000
+    import TargetedGraphs as tg
+    generator = tg.ConnectivityGenerator(size, band)
 
     # fig = plt.figure('sba')
     # ax1 = fig.add_subplot(2, 1, 1)
@@ -477,15 +466,22 @@ def test_sba():
     messages = []
     rebroadcaster = []
     for i in range(samples):
-        graph, laplacian = random_graph(size)
-        x_lst.append(get_connectivity(laplacian))
-        if 1.1 > x_lst[-1] > 0.9:
-            setup_sending_SBA(graph, 5)
-            mes_num, max_mes = get_message_counter(graph)
-            messages.append(mes_num)
-            rebroadcaster.append(get_num_sender(graph))
-            print x_lst[-1], messages[-1], rebroadcaster[-1], max_mes
-            # Graph.print_graph(graph)
+        try:
+            laplacian, conn = generator.sample(max_candidates)
+        except RuntimeError as error:
+            print error
+            break
+        graph = setup_graph(laplacian)
+        x_lst.append(conn)
+        setup_sending_SBA(graph, 5)
+        mes_num, max_mes = get_message_counter(graph)
+        messages.append(mes_num)
+        rebroadcaster.append(get_num_sender(graph))
+        print x_lst[-1], messages[-1], rebroadcaster[-1], max_mes
+        # Graph.print_graph(graph)
+    generator.report()
+    if not x_lst:
+        return
     mx = zip(x_lst, messages)
     mx.sort()
     xm, messages = zip(*mx)
@@ -501,79 +497,166 @@ def test_sba():
     plt.show()
 
 
-def arrange_data(size, flood, ahbp_dict, sba_dict):
+def test_half_sba_table(size=10, samples=100):
     """
-    Delete all entries in ahbp, sba which are equal to the corresponding in the flood list
+    Check the forwarding-table half-SBA against the object simulation
 
-    Dictionaries with algebraic connectivity as key and max number of messages processed as value
-    If the latter 2 dictionaries have a value for a key equal to the one in the flood-dict then delete it.
-    Lastly turn them into OrderedDict( dictionaries that can be sorted)
+    For random graphs compare the number of messages, the max load and
+    the number of rebroadcasters of both versions and print mismatches.
 
-    Arguments:
-    flood -- Dictionary containing the data from flooding the graph
-    ahbp_dict -- Dictionary containing the data from performing the AHBP algorithm
-    sba_dict -- Dictionary containing the data from performing the SBA algorithm
+    Return-type:
+    mismatches -- number of samples with different results
+    """
+    mismatches = 0
+    for i in range(samples):
+        graph, laplacian = random_graph(size)
+        table_result = setup_sending_half_sba_table(graph)
+        setup_sending_half_sba(graph)
+        mes_num, max_mes = get_message_counter(graph)
+        object_result = (mes_num, max_mes, get_num_sender(graph))
+        if table_result != object_result:
+            mismatches += 1
+            print 'mismatch', object_result, table_result
+        clear_graph_data(graph)
+    print 'samples:', samples, 'mismatches:', mismatches
+    return mismatches
+
+
+def test_batches(size=15, samples=10, rng=random):
+    """
+    Check the batch engine against the object simulation
+
+    For random graphs compare the number of messages, the max load, the
+    number of rebroadcasters and the first receipts of flooding and half-SBA
+    with message batches against setup_sending_flooding and
+    setup_sending_half_sba and print mismatches.
 
     Return-type:
-    ordered_flood -- OrderedDict; contains the same as flood
-    ordered_ahbp -- OrderedDict; filtered ahbp_dict
-    ordered_sba -- OrderedDict; filtered sba_dict
-    """
-    worst_case = 5*(size-1)
-    for conn in ahbp_dict:
-        deleter = []
-        for number in ahbp_dict[conn]:
-            if number == worst_case:
-                deleter.append(number)
-        for trash in deleter:
-            ahbp_dict[conn].remove(trash)
-    for conn in sba_dict:
-        deleter = []
-        for number in sba_dict[conn]:
-            if number == worst_case:
-                deleter.append(number)
-        for trash in deleter:
-            sba_dict[conn].remove(trash)
-    for conn, values in ahbp_dict.items():
-        if not values:  # if values list is empty check
-            del ahbp_dict[conn]
-    for conn, values in sba_dict.items():
-        if not values:  # if values list is empty check
-            del sba_dict[conn]
-    ordered_flood = OrderedDict(flood)
-    ordered_ahbp = OrderedDict(ahbp_dict)
-    ordered_sba = OrderedDict(sba_dict)
-    print 'flood', ordered_flood
-    print 'ahbp', ordered_ahbp
-    print 'sba', ordered_sba
-
-    return ordered_flood, ordered_ahbp, ordered_sba
-
-
-def gather_data(graph, conn, rebroad, mes, max_load):
-    """
-    Simply gathers the data from a graph onto which a sending algorithm has been performed
+    mismatches -- number of runs with different results
+    """
+    mismatches = 0
+    versions = ((setup_sending_flooding, setup_sending_flooding_batches),
+                (setup_sending_half_sba, setup_sending_half_sba_batches))
+    for i in range(samples):
+        graph, laplacian = random_graph(size, rng)
+        metrics = graph.graph['metrics']
+        for object_version, batch_version in versions:
+            object_version(graph)
+            mes_num, max_mes = get_message_counter(graph)
+            object_result = (mes_num, max_mes, get_num_sender(graph))
+            object_receipts = metrics.first_receipt.copy()
+            clear_graph_data(graph)
+            batch_result = batch_version(graph, receipts=True)
+            if (batch_result != object_result or
+                    not np.array_equal(metrics.first_receipt, object_receipts)):
+                mismatches += 1
+                print 'mismatch', object_version.__name__, object_result, batch_result
+            clear_graph_data(graph)
+    print 'samples:', samples, 'mismatches:', mismatches
+    return mismatches
 
-    Argument:
-    graph -- network.Graph object
-    conn -- alg connectivity of the graph
-    rebroad -- dictionary containing the number of retransmitting nodes
-    mes -- dict containing the number of sent messages
-    max -- dict containing the max load of a node
+
+def random_path(graph, node, length, rng=random):
+    """
+    Build a random simple path of Node objects ending in node
+
+    Walk backwards from node to random unvisited neighbors
+    until the path has the given length or the walk is stuck.
+    """
+    path = [node]
+    while len(path) < length:
+        options = [neigh for neigh in graph.neighbors(path[0]) if neigh not in path]
+        if not options:
+            break
+        path.insert(0, options[rng.randint(0, len(options) - 1)])
+    return path
+
+
+def test_brg_engine(size=12, samples=50, paths=5, rng=random):
+    """
+    Check the bitmask BRG-sets against the networkx based ones
+
+    For random graphs and random message paths ending in each node
+    compute the BRG-set with ahbp.build_BRG and ahbp.build_BRG_graph
+    and count the differences.
 
     Return-type:
-    rebroad -- dict
-    mes -- dict
-    max -- dict
+    mismatches -- number of differing BRG-sets
+    """
+    mismatches = 0
+    checked = 0
+    for i in range(samples):
+        graph, laplacian = random_graph(size, rng)
+        for node in graph.nodes():
+            node.build_2_hop(graph)
+        for node in graph.nodes():
+            for j in range(paths):
+                path = random_path(graph, node, rng.randint(1, size), rng)
+                message = nde.pac.Packet(1, 1, path[0].ID, "height", path[0])
+                for path_node in path:
+                    message.add_to_path(path_node)
+                ahbp.build_BRG_graph(node, message)
+                graph_brg = message.brg
+                ahbp.build_BRG(node, message)
+                checked += 1
+                if message.brg != graph_brg:
+                    mismatches += 1
+                    print 'mismatch', message.path, graph_brg, message.brg
+    print 'checked:', checked, 'mismatches:', mismatches
+    return mismatches
+
+
+def run_protocol(graph, protocol, seed=None, key=None, timer=2, profiler=None, hello=False):
     """
+    Run a protocol by its name and count the messages
+
+    Arguments:
+    graph -- graph of setup_graph
+    protocol -- 'flooding', 'AHBP', 'SBA', 'half_sba', 'half_sba_table',
+                'flooding_batches' or 'half_sba_batches'
+    seed -- root seed of the random timers of the SBA (None -> node.rng as it is)
+    key -- key of the sample the timers are derived for, see RandomStreams.seed_nodes
+    timer -- max timer of the SBA
+    profiler -- Profiler.PhaseProfiler of the protocols on Node objects
+    hello -- if True SBA, AHBP and half-SBA discover the neighborhood with hellos
+
+    Return-type:
+    messages -- total number of sent messages, hellos included
+    max_load -- max load of any node
+    rebroad -- number of rebroadcasting nodes
+    """
+    if protocol == 'half_sba_table':
+        return setup_sending_half_sba_table(graph)
+    elif protocol == 'flooding_batches':
+        return setup_sending_flooding_batches(graph)
+    elif protocol == 'half_sba_batches':
+        return setup_sending_half_sba_batches(graph)
+    if protocol == 'flooding':
+        setup_sending_flooding(graph, profiler=profiler)
+    elif protocol == 'AHBP':
+        setup_sending_AHBP(graph, hello=hello, profiler=profiler)
+    elif protocol == 'SBA':
+        if seed is not None:
+            rs.seed_nodes(graph, seed, key)
+        setup_sending_SBA(graph, timer, hello=hello, profiler=profiler)
+    elif protocol == 'half_sba':
+        setup_sending_half_sba(graph, hello=hello, profiler=profiler)
+    else:
+        raise ValueError('unknown protocol {0}'.format(protocol))
+    messages, max_load = get_message_counter(graph)
+    return messages, max_load, get_num_sender(graph)
+
+
+def run_record(graph, protocol, conn, size, sample, seed):
+    """Collect the numbers of a protocol run on a sample as a result record"""
     messages, max_mes = get_message_counter(graph)
-    rebroadcaster = get_num_sender(graph)
-    rebroad, mes, max_load = update_dict(mes, rebroad, max_load, conn,
-                                         rebroadcaster, messages, max_mes)
-    return rebroad, mes, max_load
+    return {'size': size, 'sample': sample, 'seed': seed, 'protocol': protocol,
+            'conn': conn, 'messages': messages, 'max_load': max_mes,
+            'rebroadcaster': get_num_sender(graph),
+            'hellos': graph.graph['metrics'].hello_messages()}
 
 
-def create_plots():
+def create_plots(seed=None, profile=None, results='results', hello=False):
     """
     Execute simulations, gather data and plot it
 
@@ -581,10 +664,27 @@ def create_plots():
     then the number of samples for each size.
     Generate random graphs and perform each broadcasting algorithm on it.
     Then get the number of retransmitting nodes, sent messages and max load of any node.
-    Finally plot it according to the graph's connectivity.
+    Every sample is written to the result files as soon as it is done
+    (see ResultSink). With a root seed, samples already in there are
+    skipped -> an interrupted sweep continues where it stopped when called
+    again. Without one every call is a new independent sweep.
+    Finally plot it according to the graph's connectivity from the result files.
+
+    If a root seed is given, every sample draws its graph and its random timers
+    from generators derived from (seed, size, sample) -> reproducible samples.
+
+    If profile is given, every run is instrumented and its timings are
+    appended as one JSON line to that file, see Profiler.load_records,
+    together with the summary of its metrics store (loads and latencies,
+    see Metrics.MetricsStore.as_dict).
 
     Argument:
-    --
+    seed -- root seed of the sweep (default = None -> global random module)
+    profile -- name of a file for the timings of the runs (default = None -> off)
+    results -- directory of the result files
+    hello -- if True the protocols discover their neighborhood with hellos,
+             their cost is part of the messages and kept in the hellos column
+
     Return-type:
     Plot a graph with possibility to arrange and save it manually
     """
@@ -594,13 +694,93 @@ def create_plots():
     # x_lst = [i for i in range(2, max_size+1)]
     x_lst = [3]
 
+    protocols = ('flooding', 'AHBP', 'SBA')
+    done = sink.completed_samples(results, seed, protocols)
+    # the records of an unseeded sweep are kept apart by their own id
+    sweep = seed if seed is not None else sink.new_sweep_id(results)
+    with sink.ResultSink(results) as result_sink:
+        for size in x_lst:
+            print size
+            # for a in range(samples):
+            for a in range(samples):
+                if (size, a) in done:
+                    continue
+                conn = -1
+                graph_rng = random
+                if seed is not None:
+                    graph_rng = rs.graph_stream(seed, (size, a))
+                while conn < 0:
+                    graph, laplacian = random_graph(size, graph_rng)
+                    conn = round_connectivity(get_connectivity(laplacian), size)
+                profilers = {}
+                if profile is not None:
+                    profilers = dict((name, prof.PhaseProfiler()) for name in protocols)
+                records = []
+                summaries = {}
+                for protocol in protocols:
+                    run_protocol(graph, protocol, seed, (size, a),
+                                 profiler=profilers.get(protocol), hello=hello)
+                    records.append(run_record(graph, protocol, conn, size, a, sweep))
+                    if profile is not None:
+                        summaries[protocol] = graph.graph['metrics'].as_dict()
+                    # set all the sender flags to false again
+                    # so one can reuse the same graph
+                    clear_graph_data(graph)
+                # all protocols of a sample are appended at once
+                result_sink.append(records)
+                if profile is not None:
+                    with open(profile, 'a') as outfile:
+                        for name in sorted(profilers):
+                            profilers[name].dump(outfile, protocol=name, size=size,
+                                                 sample=a, conn=conn, seed=seed,
+                                                 metrics=summaries[name])
+
+    plot_results(results, x_lst, sweep)
+
+
+def size_stats(columns, size, protocols):
+    """
+    Aggregate the records of a graph size
+
+    Arguments:
+    columns -- result columns, see ResultSink.read_results
+    size -- graph size
+    protocols -- names of the protocols
+
+    Return-type:
+    stats -- OnlineStats.StatsAggregator with messages, rebroadcaster and max_load
+    """
+    stats = ostats.StatsAggregator(value_counts=('max_load',))
+    for protocol in protocols:
+        rows = sink.select(columns, size=size, protocol=protocol)
+        stats.add_batch(protocol, rows['conn'], messages=rows['messages'],
+                        rebroadcaster=rows['rebroadcaster'], max_load=rows['max_load'])
+    return stats
+
+
+def plot_results(results, x_lst, seed=None):
+    """
+    Plot the records in the result files
+
+    Arguments:
+    results -- directory of the result files
+    x_lst -- graph sizes to plot
+    seed -- only plot the records of this root seed or unseeded sweep id
+            (None -> the latest unseeded sweep)
+
+    Return-type:
+    Plot a graph with possibility to arrange and save it manually
+    """
+    columns = sink.read_results(results)
+    columns = sink.select(columns, seed=sink.last_sweep_id(columns) if seed is None else seed)
+    protocols = ('flooding', 'AHBP', 'SBA')
+
     fig3 = plt.figure('Max buffer-length')
     fig2 = plt.figure('Messages sent')
     fig1 = plt.figure('Retransmitting nodes')
 
     for index in range(len(x_lst)):
         size = x_lst[index]
-        print size
         if len(x_lst) == 1:
             ax1 = fig1.add_subplot(1, 1, index + 1)
             ax2 = fig2.add_subplot(1, 1, index + 1)
@@ -610,61 +790,24 @@ def create_plots():
             ax2 = fig2.add_subplot(round(len(x_lst)/2, 0), 2, index + 1)
             ax3 = fig3.add_subplot(round(len(x_lst)/2, 0), 2, index + 1)
 
-        flood_mes = {}
-        ahbp_mes = {}
-        sba_mes = {}
-
-        flood_rebroad = {}
-        ahbp_rebroad = {}
-        sba_rebroad = {}
-
-        flood_max = {}
-        ahbp_max = {}
-        sba_max = {}
-
-        # for a in range(samples):
-        for a in range(samples):
-            conn = -1
-            while conn < 0:
-                graph, laplacian = random_graph(x_lst[index])
-                if x_lst[index] > 20:
-                    conn = round(get_connectivity(laplacian), 4)
-                elif x_lst[index] == 20:
-                    conn = round(get_connectivity(laplacian), 3)
-                else:
-                    conn = round(get_connectivity(laplacian), 2)
-            # get values for flooding
-            setup_sending_flooding(graph)
-            flood_rebroad, flood_mes, flood_max = gather_data(graph, conn, flood_rebroad, flood_mes, flood_max)
-            # set all the sender flags to false again
-            # so one can reuse the same graph
-            clear_graph_data(graph)
-            # get values for AHBP
-            setup_sending_AHBP(graph)
-            ahbp_rebroad, ahbp_mes, ahbp_max = gather_data(graph, conn, ahbp_rebroad, ahbp_mes, ahbp_max)
-            clear_graph_data(graph)
-            # get values for SBA
-            setup_sending_SBA(graph, 2)
-            sba_rebroad, sba_mes, sba_max = gather_data(graph, conn, sba_rebroad, sba_mes, sba_max)
-            clear_graph_data(graph)
+        stats = size_stats(columns, size, protocols)
 
         # plot number of retransmitting nodes
-        flood_rebroad = average_std(flood_rebroad)
-        ahbp_rebroad = average_std(ahbp_rebroad)
-        sba_rebroad = average_std(sba_rebroad)
-        Graph.plot_data(flood_rebroad, ahbp_rebroad, sba_rebroad, ax1)
+        Graph.plot_data(stats.mean_std('flooding', 'rebroadcaster'),
+                        stats.mean_std('AHBP', 'rebroadcaster'),
+                        stats.mean_std('SBA', 'rebroadcaster'), ax1)
 
         # plot number of messages sent
-        flood_mes = average_std(flood_mes)
-        ahbp_mes = average_std(ahbp_mes)
-        sba_mes = average_std(sba_mes)
-        Graph.plot_data(flood_mes, ahbp_mes, sba_mes, ax2)
+        Graph.plot_data(stats.mean_std('flooding', 'messages'),
+                        stats.mean_std('AHBP', 'messages'),
+                        stats.mean_std('SBA', 'messages'), ax2)
 
         #plot max load of any node in the graph
-        flood_max, ahbp_max, sba_max = arrange_data(size, flood_max, ahbp_max, sba_max)
-        Graph.plot_maxload(flood_max, ax3, 'flood')
-        Graph.plot_maxload(ahbp_max, ax3, 'ahbp')
-        Graph.plot_maxload(sba_max, ax3, 'sba')
+        # AHBP and SBA values equal to the worst case are left out
+        worst_case = 5*(size-1)
+        Graph.plot_maxload(stats.values('flooding', 'max_load'), ax3, 'flood')
+        Graph.plot_maxload(stats.values('AHBP', 'max_load', (worst_case,)), ax3, 'ahbp')
+        Graph.plot_maxload(stats.values('SBA', 'max_load', (worst_case,)), ax3, 'sba')
 
         #format the plots
         Graph.format_plots(ax1, size, 'retransmission')
@@ -703,7 +846,21 @@ def lattice_graph(length):
     return graph
 
 
-def build_rand_graph(num_nodes):
+def build_rand_graph(num_nodes, rng=random, length=None):
+    """
+    Build the DFA-like random graph and return its laplacian
+
+    See build_rand_nx_graph for the arguments.
+
+    Return-type:
+    laplacian-matrix -- numpy array
+    """
+    graph = build_rand_nx_graph(num_nodes, rng, length)
+    laplacian_matrix = nx.laplacian_matrix(graph)
+    return laplacian_matrix.getA()
+
+
+def build_rand_nx_graph(num_nodes, rng=random, length=None):
     """
     Build the DFA-like random graph
 
@@ -713,17 +870,21 @@ def build_rand_graph(num_nodes):
     check if one of the subgraphs has still enough vertices.
     Continue computation with this subgraph.
     Else delete another vertex.
-    Return the laplacian representation of the graph
 
     Arguments:
     num_nodes -- number of nodes the resulting graph should have
+    rng -- random generator choosing the deleted nodes (default = random module)
+    length -- side of the initial lattice, at least sqrt(num_nodes);
+              (default = num_nodes, gets slow for big graphs)
 
     Return-type:
-    laplacian-matrix -- numpy array
+    graph -- networkx.Graph object
     """
     # root = math.sqrt(num_nodes)
     # length = int(math.ceil(root))
-    graph = lattice_graph(num_nodes)
+    if length is None:
+        length = num_nodes
+    graph = lattice_graph(length)
     # for node_name in graph.node:
     #     graph.node[node_name]['color'] = 'red'
     # pos = nx.spring_layout(graph)
@@ -732,7 +893,7 @@ def build_rand_graph(num_nodes):
         # after removing a node try another one
         connect_bool = False
         while not connect_bool:
-            node_index = random.randint(0, len(graph)-1)
+            node_index = rng.randint(0, len(graph)-1)
             removed_node = graph.nodes()[node_index]
             removed_edges = graph.edges(removed_node)
             # graph.node[removed_node]['color'] = 'blue'
@@ -772,9 +933,7 @@ def build_rand_graph(num_nodes):
 
     # nx.draw(graph)
     # plt.show()
-
-    laplacian_matrix = nx.laplacian_matrix(graph)
-    return laplacian_matrix.getA()
+    return graph
 
 
 def main():
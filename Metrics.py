@@ -0,0 +1,213 @@
+from __future__ import division
+"""
+This file contains the metrics store of the broadcast simulations.
+Instead of a message_counter list per node, all counters live in NumPy
+arrays indexed by [round, node ID], shared by all nodes of a graph
+(graph.graph['metrics'], node.metrics):
+sends -- transmissions of a message (one per message and sending event)
+receptions -- received copies
+duplicates -- received copies of messages which were known already
+              or arrived twice in the same round
+rebroadcasts -- True if the node sent a foreign message in the round
+hellos -- sent hellos of the neighbor discovery, kept apart from the
+          data messages; messages() and max_load() add them with
+          include_hello=True, which Main.get_message_counter reports
+Besides, the int32 matrix first_receipt[i, j] holds the round in which
+node i learned the message of origin j (-1 -> never), filled by Node.learn.
+The latencies and the iteration plots are derived from it.
+The totals (get_message_counter, get_num_sender) and the time series
+are array reductions over these columns.
+"""
+import numpy as np
+
+# every transmission counts 5 like the former message_counter entries
+MESSAGE_COST = 5
+COLUMNS = (('sends', np.int64),
+           ('receptions', np.int64),
+           ('duplicates', np.int64),
+           ('rebroadcasts', bool),
+           ('hellos', np.int64))
+
+
+class MetricsStore(object):
+    """
+    Per-node, per-round counters of a broadcast
+
+    Arguments:
+    size -- number of nodes, the node IDs are 0 .. size - 1
+    capacity -- initial number of rounds, doubled when exceeded
+
+    Instance attributes:
+    round -- round in which the counters are recorded, see start_round
+    rounds -- number of started rounds, round 0 is always started
+    sends, receptions, duplicates, rebroadcasts, hellos -- arrays [capacity, size]
+    first_receipt -- int32 array [node, origin] with the round of the first receipt,
+                     -1 if unknown; allocated by receipts, e.g. with the first
+                     learned message
+    """
+    def __init__(self, size, capacity=16):
+        self.size = size
+        self.capacity = capacity
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.zeros((capacity, size), dtype=dtype))
+        self.rounds = 0
+        self.start_round(0)
+        self.first_receipt = None
+
+    def reset(self):
+        """Clear all counters"""
+        for name, dtype in COLUMNS:
+            getattr(self, name)[:self.rounds] = 0
+        self.rounds = 0
+        self.start_round(0)
+        if self.first_receipt is not None:
+            self.reset_receipts()
+
+    def receipts(self):
+        """The first_receipt matrix, allocated with -1 (never) on first use"""
+        if self.first_receipt is None:
+            # n x n, thus only for graphs whose first receipts are asked for
+            self.first_receipt = np.full((self.size, self.size), -1, dtype=np.int32)
+        return self.first_receipt
+
+    def reset_receipts(self):
+        """Mark all messages as never received"""
+        self.receipts().fill(-1)
+
+    def start_round(self, iteration):
+        """Record the following events in round iteration"""
+        if iteration >= self.capacity:
+            capacity = max(2 * self.capacity, iteration + 1)
+            for name, dtype in COLUMNS:
+                column = np.zeros((capacity, self.size), dtype=dtype)
+                column[:self.capacity] = getattr(self, name)
+                setattr(self, name, column)
+            self.capacity = capacity
+        self.round = iteration
+        self.rounds = max(self.rounds, iteration + 1)
+        # rows of the round; indexing a 1d row is cheaper in the hot loops
+        self.row_sends = self.sends[iteration]
+        self.row_receptions = self.receptions[iteration]
+        self.row_duplicates = self.duplicates[iteration]
+        self.row_rebroadcasts = self.rebroadcasts[iteration]
+        self.row_hellos = self.hellos[iteration]
+
+    def record_sends(self, node_id, count, rebroadcast):
+        """
+        Record count transmissions of a node
+
+        Arguments:
+        node_id -- ID of the sending node
+        count -- number of transmitted messages
+        rebroadcast -- True if a message of another node was among them
+        """
+        self.row_sends[node_id] += count
+        if rebroadcast:
+            self.row_rebroadcasts[node_id] = True
+
+    def record_hello(self, node_id):
+        """Record a hello sent by a node"""
+        self.row_hellos[node_id] += 1
+
+    def record_reception(self, node_id, duplicate):
+        """Record a received copy; duplicate -> the message was no news"""
+        self.row_receptions[node_id] += 1
+        if duplicate:
+            self.row_duplicates[node_id] += 1
+
+    def record_learned(self, node_id, origin_id):
+        """Record the current round as the first receipt of the message of origin_id"""
+        first_receipt = self.first_receipt
+        if first_receipt is None:
+            first_receipt = self.receipts()
+        first_receipt[node_id, origin_id] = self.round
+
+    def column(self, name):
+        """Array [round, node] of a counter up to the last recorded round"""
+        return getattr(self, name)[:self.rounds]
+
+    def node_totals(self, name):
+        """Total of a counter per node"""
+        return self.column(name).sum(axis=0)
+
+    def round_totals(self, name):
+        """Total of a counter per round, e.g. the transmissions per round"""
+        return self.column(name).sum(axis=1)
+
+    def messages(self, include_hello=False):
+        """Total number of sent messages like Main.get_message_counter"""
+        total = self.sends[:self.rounds].sum()
+        if include_hello:
+            total += self.hellos[:self.rounds].sum()
+        return MESSAGE_COST * int(total)
+
+    def hello_messages(self):
+        """Total number of sent hellos, counted like the data messages"""
+        return MESSAGE_COST * int(self.hellos[:self.rounds].sum())
+
+    def max_load(self, include_hello=False):
+        """Max load of any node without its own message like Main.get_message_counter"""
+        loads = self.node_totals('sends')
+        if include_hello:
+            loads = loads + self.node_totals('hellos')
+        return MESSAGE_COST * int(loads.max() if len(loads) else 0) - MESSAGE_COST
+
+    def rebroadcasters(self):
+        """Number of nodes which sent a foreign message like Main.get_num_sender"""
+        return int(self.column('rebroadcasts').any(axis=0).sum())
+
+    def round_load(self):
+        """Time series of the sent messages of the whole network per round"""
+        return MESSAGE_COST * self.round_totals('sends')
+
+    def max_round_load(self):
+        """Time series of the biggest number of sent messages of a node per round"""
+        sends = self.column('sends')
+        if not sends.size:
+            return np.zeros(self.rounds, dtype=np.int64)
+        return MESSAGE_COST * sends.max(axis=1)
+
+    def completion_rounds(self):
+        """Round in which every node knew all messages, -1 if it never did"""
+        if self.first_receipt is None:
+            return -np.ones(self.size, dtype=np.int32)
+        rounds = self.first_receipt.max(axis=1)
+        rounds[(self.first_receipt < 0).any(axis=1)] = -1
+        return rounds
+
+    def latencies(self):
+        """Rounds between the start and the first receipt of all foreign messages that arrived"""
+        if self.first_receipt is None:
+            return np.zeros(0, dtype=np.int32)
+        foreign = ~np.eye(self.size, dtype=bool)
+        values = self.first_receipt[foreign]
+        return values[values >= 0]
+
+    def latency_stats(self):
+        """
+        Summary of the latencies
+
+        Return-type:
+        stats -- dict with mean, median and max latency, the number of
+                 missing receipts and the round the whole network was done (-1 -> never)
+        """
+        values = self.latencies()
+        completion = self.completion_rounds()
+        missing = self.size * (self.size - 1) - len(values)
+        return {'mean': float(values.mean()) if len(values) else float('nan'),
+                'median': float(np.median(values)) if len(values) else float('nan'),
+                'max': int(values.max()) if len(values) else -1,
+                'missing': int(missing),
+                'completion': int(completion.max()) if (completion >= 0).all() else -1}
+
+    def as_dict(self):
+        """Totals, time series and latencies as plain values, e.g. for json"""
+        return {'messages': self.messages(),
+                'max_load': self.max_load(),
+                'rebroadcaster': self.rebroadcasters(),
+                'hellos': self.hello_messages(),
+                'receptions': int(self.column('receptions').sum()),
+                'duplicates': int(self.column('duplicates').sum()),
+                'round_load': self.round_load().tolist(),
+                'max_round_load': self.max_round_load().tolist(),
+                'latency': self.latency_stats()}
@@ -27,26 +27,40 @@ class Node(object):
 
         Instance attributes:
         ID -- identification number of a node
-        data_stack -- list with all messages known to the node
-        receive_buffer -- list with all incoming messages during an iteration
+        data_stack -- list with all messages known to the node; only appended to
+        receive_buffer -- list with all incoming messages during an iteration;
+                          copies of the same message are merged into one entry
+        receive_index -- dict with the message identifier as key and
+                         the entry in the receive_buffer as value
         sending_buffer -- list with all outgoing messages during an iteration
-        sender -- Flag indicating if a node rebroadcasts any messages
         flag -- Indicate which sending algorithm is used
         two_hop_dict -- Dict with 1-hop neighbors as key and 2-hop neigh as their values
+        local_two_hop -- AHBPClass.LocalTwoHop built from the two_hop_dict
         cover_dict -- Cover-set for the SBA
-        message_counter -- Keep track of the sent messages by the node
+        metrics -- Metrics.MetricsStore of the graph, counts the sent and received messages
+        rng -- random generator of the node; the random module unless seeded
+        neigh_lists -- neighbor lists advertised by the 1-hop neighbors (hello)
+        two_hop_via -- dict node -> set of 1-hop neighbors advertising it (hello)
+        advertised -- set of neighbors in the last sent hello, None before the first
+        hello_synced -- neighbors which received the whole neighbor list
+        hello_pending -- True if the link layer reported a change
+        hello_buffer -- incoming hellos
 
         Most important Methods:
         send_to_neighbor -- send the whole sending_buffer to a neighbor
         update_data -- check the receive_buffer for unknown messages
+        learn -- take a new message into the data_stack
         init_1_data -- initiate the nodes with a message
         """
         self._ID = self.__class__.obj_counter
         self._data_stack = []
+        # identifiers of the messages in the data_stack, see check_data_stack
+        self._known = set()
+        self._known_len = 0
         self.receive_buffer = []  # packet list for incoming data
+        self.receive_index = {}  # identifier -> packet in the receive_buffer
         self.sending_buffer = []  # list conaining the packets to be send
         self.__class__.obj_counter += 1
-        self.sender = False
         # matrix which stores the info when a node receive a packet
         # self.packet_history = np.zeros((size, 1))
         self.flag = ""
@@ -58,8 +72,20 @@ class Node(object):
         self.cover_dict = {}
         # contains the two_hop-neighborhood. 1-hop are keys; 2-hop neigh their values
         self.two_hop_dict = {}
-        # track the number of sent messages by the node
-        self.message_counter = []
+        # bitmask version of the two_hop_dict for the BRG-sets; built on demand
+        self.local_two_hop = None
+        # counters of the whole graph, set by Main.setup_graph
+        self.metrics = None
+        # random generator, replaced by a seeded one in RandomStreams.seed_nodes
+        self.rng = random
+        # state of the hello protocol, see HelloProtocol
+        self.neigh_lists = {}
+        self.two_hop_via = {}
+        self.advertised = None
+        self.hello_synced = set()
+        self.hello_pending = False
+        self.hello_seq = 0
+        self.hello_buffer = []
 
     def build_2_hop(self, graph):
         """
@@ -78,6 +104,7 @@ class Node(object):
         Return-type:
         None
         """
+        self.local_two_hop = None
         for node in graph.neighbors(self):
             two_hop_lst = []
             for neigh in graph.neighbors(node):
@@ -85,6 +112,16 @@ class Node(object):
                     two_hop_lst.append(neigh)
             self.two_hop_dict[node] = two_hop_lst
 
+    def __hash__(self):
+        """
+        Hash a node by its ID
+
+        The iteration order of the graph dictionaries then does not depend
+        on the memory address of the node -> same order in every process.
+        Equality is still identity.
+        """
+        return self._ID
+
     def get_ID(self):
         """ID getter"""
         return self._ID
@@ -96,30 +133,33 @@ class Node(object):
     def set_data_stack(self, data_list):
         """data_stack setter"""
         self._data_stack = data_list
+        self._known = set()
+        self._known_len = 0
 
     def check_data_stack(self, data):
         """
         Check if a message is known
 
         Returns  True if the message is already known and False if it is unknown
+        A message is known if one in the data_stack has the same origin,
+        seq_number and type. Messages are only appended to the data_stack,
+        thus the set of known identifiers is extended by the new ones
+        instead of scanning the whole data_stack each time.
 
         Return-type:
         Boolean
         """
         assert type(data) == pac.Packet
-        for item in self.data_stack:
-            origin_check = 0
-            seq_check = 0
-            type_check = 0
-            if data.origin == item.origin:
-                origin_check = 1
-            if data.type == item.type:
-                type_check = 1
-            if data.seq_number == item.seq_number:
-                seq_check = 1
-            if origin_check == 1 and seq_check == 1 and type_check == 1:
-                return True
-        return False
+        return self.knows((data.origin, data.seq_number, data.type))
+
+    def knows(self, identifier):
+        """True if a message with the identifier (origin, seq_number, type) is known"""
+        stack = self._data_stack
+        while self._known_len < len(stack):
+            item = stack[self._known_len]
+            self._known.add((item.origin, item.seq_number, item.type))
+            self._known_len += 1
+        return identifier in self._known
 
     def del_data_stack(self):
         """Delete the data_stack of a node"""
@@ -132,6 +172,32 @@ class Node(object):
     def del_receive_buffer(self):
         """Delete the receive_buffer"""
         self.receive_buffer = []
+        self.receive_index = {}
+
+    def enqueue(self, message, sender):
+        """
+        Put a copy of the message sent by sender into the receive_buffer
+
+        Only the first copy of a message during an iteration is stored.
+        Every further copy just adds its sender to the senders of that entry.
+        Thus the first sender stays the last_node of the message, as if
+        the copies were processed one after another.
+        The copy is recorded in the metrics, as duplicate if it brings nothing new.
+
+        Arguments:
+        message -- Packet instance sent by the sender
+        sender -- Node instance sending the message
+        """
+        identifier = (message.origin, message.seq_number, message.type)
+        entry = self.receive_index.get(identifier)
+        self.metrics.record_reception(self.ID, entry is not None or self.knows(identifier))
+        if entry is None:
+            # deepcopy guarantees everything is copied
+            entry = copy.deepcopy(message)
+            entry.last_node = sender
+            self.receive_buffer.append(entry)
+            self.receive_index[identifier] = entry
+        entry.senders.append(sender)
 
     def send_to_neighbor(self, neighbors):
         """
@@ -140,26 +206,27 @@ class Node(object):
         Push each message in the sending_buffer to every node in the neighbors list.
         Neglect for each message its last node.
         All ports except the one through which the message came in have to
-        process the message. Thus add 5 to the message counter.
+        process the message. Thus count one transmission (5 messages) per message
+        in the metrics.
 
         Argument:
         neighbors -- node instances
         """
+        sends = 0
+        rebroadcast = False
         for item in self.sending_buffer:
             counter = 0
             for neighbor in neighbors:
                 if neighbor != item.last_node:
                     counter = 1
-                    # deepcopy guarantees everything is copied
-                    neighbor.receive_buffer.append(copy.deepcopy(item))
-                    neighbor.receive_buffer[-1].last_node = self
-                    # set the sender flag to true only for sending nodes
-                    # which are not the source of the message
+                    neighbor.enqueue(item, self)
+                    # the node is a rebroadcaster only for messages
+                    # of which it is not the source
                     if item.origin != self.ID + 1:
-                        self.sender = True
-            if counter == 1:
-                # append 5 for each message in the sending_buffer
-                self.message_counter.append(5)
+                        rebroadcast = True
+            sends += counter
+        if sends:
+            self.metrics.record_sends(self.ID, sends, rebroadcast)
 
     def update_data(self, flag):
         """
@@ -175,8 +242,7 @@ class Node(object):
         for message in self.receive_buffer:
             boolean = self.check_data_stack(message)
             if not boolean:
-                message.add_to_path(self)
-                self.data_stack.append(message)
+                self.learn(message)
                 if flag != "SBA":
                     self.sending_buffer.append(message)
                     # the value is stored in the row = to the origin of the packet
@@ -187,7 +253,18 @@ class Node(object):
             elif boolean:
                 pass
 
-    def init_1_data(self):
+    def learn(self, message):
+        """
+        Take a new message into the data_stack
+
+        The node is added to the message path and the round is recorded
+        as the first receipt of the message in the metrics.
+        """
+        message.add_to_path(self)
+        self._data_stack.append(message)
+        self.metrics.record_learned(self.ID, message.origin - 1)
+
+    def init_1_data(self, tracking=None):
         """
         Create a data-message and append it to the node
 
@@ -195,10 +272,13 @@ class Node(object):
         and last_node equals oneself
 
         Appends the message to the data_stack and sending_bufffer
+
+        Arguments:
+        tracking -- path tracking policy of the message, see Package.path_tracking
+                    (default = full path)
         """
-        new_packet = pac.Packet(self.ID + 1, 1, self.ID, "height", self)
-        new_packet.add_to_path(self)
-        self.data_stack.append(new_packet)
+        new_packet = pac.Packet(self.ID + 1, 1, self.ID, "height", self, tracking)
+        self.learn(new_packet)
         self.sending_buffer.append(new_packet)
         # self.packet_history[self.ID, :] = new_packet.value
 
@@ -0,0 +1,273 @@
+from __future__ import division
+"""
+This file contains the streaming statistics of the simulation results.
+Instead of keeping every measured value in lists, the StatsAggregator keeps
+per (protocol, metric, connectivity bin) the count, mean and variance
+(Welford), optionally quantile estimates (P^2 algorithm) and for discrete
+metrics like the max load the counts of the values.
+The memory does not grow with the number of samples.
+Batches of values (e.g. read from the result files) are reduced group-wise
+with NumPy and merged into the running statistics.
+"""
+import math
+import numpy as np
+
+
+class RunningStats(object):
+    """
+    Count, mean, variance, min and max of a stream of values (Welford)
+
+    Instance attributes:
+    count -- number of values
+    mean -- mean of the values
+    m2 -- sum of the squared deviations from the mean
+    minimum, maximum -- smallest and biggest value
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def add(self, value):
+        """Add one value"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, count, mean, m2, minimum, maximum):
+        """Add the moments of a group of values (Chan et al.)"""
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def variance(self, ddof=0):
+        """Variance; ddof=0 like np.std, ddof=1 for the sample variance"""
+        if self.count <= ddof:
+            return float('nan')
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        return math.sqrt(self.variance(ddof))
+
+    def sem(self):
+        """Standard error of the mean"""
+        if self.count < 2:
+            return float('inf')
+        return self.std(1) / math.sqrt(self.count)
+
+
+class P2Quantile(object):
+    """
+    Streaming estimate of a quantile with five markers (P^2 algorithm, Jain/Chlamtac)
+
+    Instance attributes:
+    quantile -- the estimated quantile in [0, 1]
+    heights -- marker heights, heights[2] is the estimate
+    positions -- actual marker positions
+    desired -- desired marker positions
+    """
+    def __init__(self, quantile):
+        q = quantile
+        self.quantile = q
+        self.heights = []
+        self.positions = [1., 2., 3., 4., 5.]
+        self.desired = [1., 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5.]
+        self.increments = [0., q / 2, q, (1 + q) / 2, 1.]
+
+    def add(self, value):
+        h = self.heights
+        if len(h) < 5:
+            h.append(value)
+            h.sort()
+            return
+        n = self.positions
+        if value < h[0]:
+            h[0] = value
+            k = 0
+        elif value >= h[4]:
+            h[4] = value
+            k = 3
+        else:
+            k = 0
+            while not h[k] <= value < h[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < height < h[i + 1]:
+                    # parabolic prediction out of order -> linear one
+                    height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = height
+                n[i] += d
+
+    def value(self):
+        """Current estimate; exact as long as there are less than 5 values"""
+        if not self.heights:
+            return float('nan')
+        if len(self.heights) < 5:
+            return float(np.percentile(self.heights, 100 * self.quantile))
+        return self.heights[2]
+
+
+def grouped_moments(groups, values):
+    """
+    Count, mean, m2, min and max of the values of every group at once
+
+    Arguments:
+    groups -- numpy array with the group of every value
+    values -- numpy array of the values
+
+    Return-type:
+    keys, counts, means, m2s, minima, maxima -- numpy arrays, one entry per group
+    """
+    values = np.asarray(values, dtype=float)
+    keys, inverse = np.unique(groups, return_inverse=True)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, values) / counts
+    m2s = np.bincount(inverse, (values - means[inverse]) ** 2)
+    order = np.argsort(inverse, kind='mergesort')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    minima = np.minimum.reduceat(values[order], starts)
+    maxima = np.maximum.reduceat(values[order], starts)
+    return keys, counts, means, m2s, minima, maxima
+
+
+class StatsAggregator(object):
+    """
+    Streaming statistics per (protocol, metric, connectivity bin)
+
+    Arguments:
+    quantiles -- quantiles estimated for every cell, e.g. (0.5, 0.9)
+    value_counts -- metrics whose values are counted, e.g. ('max_load',)
+    digits -- the connectivity is rounded to this number of digits
+              to get its bin (default = None -> taken as it is)
+    """
+    def __init__(self, quantiles=(), value_counts=(), digits=None):
+        self.quantiles = tuple(quantiles)
+        self.value_counts = tuple(value_counts)
+        self.digits = digits
+        self.stats = {}
+        self.sketches = {}
+        self.counts = {}
+
+    def conn_bin(self, conn):
+        conn = float(conn)
+        if self.digits is not None:
+            conn = round(conn, self.digits)
+        return conn
+
+    def cell(self, protocol, metric, conn_bin):
+        """RunningStats of a cell, created if it does not exist"""
+        key = (protocol, metric, conn_bin)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RunningStats()
+            self.sketches[key] = [P2Quantile(q) for q in self.quantiles]
+            if metric in self.value_counts:
+                self.counts[key] = {}
+        return stats
+
+    def add(self, protocol, conn, **metrics):
+        """Add the metrics of one run, e.g. add('SBA', 0.5, messages=30, max_load=10)"""
+        conn_bin = self.conn_bin(conn)
+        for metric, value in metrics.items():
+            self.cell(protocol, metric, conn_bin).add(value)
+            key = (protocol, metric, conn_bin)
+            for sketch in self.sketches[key]:
+                sketch.add(value)
+            if metric in self.value_counts:
+                self.counts[key][value] = self.counts[key].get(value, 0) + 1
+
+    def add_batch(self, protocol, conns, **metrics):
+        """
+        Add many runs of a protocol at once
+
+        Arguments:
+        protocol -- name of the protocol
+        conns -- array with the connectivity of every run
+        metrics -- arrays with the values of every run
+        """
+        conns = np.asarray(conns, dtype=float)
+        if not len(conns):
+            return
+        if self.digits is not None:
+            conns = np.round(conns, self.digits)
+        for metric, values in metrics.items():
+            values = np.asarray(values)
+            moments = grouped_moments(conns, values)
+            for conn_bin, count, mean, m2, minimum, maximum in zip(*moments):
+                self.cell(protocol, metric, float(conn_bin)).merge(
+                    int(count), mean, m2, minimum, maximum)
+            if self.quantiles:
+                for conn, value in zip(conns, values):
+                    for sketch in self.sketches[(protocol, metric, float(conn))]:
+                        sketch.add(value)
+            if metric in self.value_counts:
+                pairs = np.column_stack((conns, values))
+                pairs, numbers = unique_rows(pairs)
+                for (conn, value), number in zip(pairs, numbers):
+                    counts = self.counts[(protocol, metric, float(conn))]
+                    value = values.dtype.type(value).item()
+                    counts[value] = counts.get(value, 0) + int(number)
+
+    def bins(self, protocol, metric):
+        """Sorted connectivity bins with values of a protocol and metric"""
+        return sorted(key[2] for key in self.stats if key[:2] == (protocol, metric))
+
+    def mean_std(self, protocol, metric):
+        """Dict conn -> [rounded mean, std] like the one for Graph.plot_data"""
+        result = {}
+        for conn_bin in self.bins(protocol, metric):
+            stats = self.stats[(protocol, metric, conn_bin)]
+            result[conn_bin] = [round(stats.mean, 0), stats.std()]
+        return result
+
+    def values(self, protocol, metric, exclude=()):
+        """
+        Dict conn -> list of the values, for a metric with value counts
+
+        Values in exclude are left out, bins without any value left are dropped.
+        """
+        result = {}
+        for conn_bin in self.bins(protocol, metric):
+            counts = self.counts[(protocol, metric, conn_bin)]
+            lst = []
+            for value in sorted(counts):
+                if value not in exclude:
+                    lst.extend([value] * counts[value])
+            if lst:
+                result[conn_bin] = lst
+        return result
+
+    def quantile(self, protocol, metric, conn_bin, quantile):
+        """Estimate of a quantile given at the creation of the aggregator"""
+        index = self.quantiles.index(quantile)
+        return self.sketches[(protocol, metric, conn_bin)][index].value()
+
+
+def unique_rows(rows):
+    """Unique rows of a 2d array and how often they occur"""
+    rows = np.ascontiguousarray(rows)
+    view = rows.view([('', rows.dtype)] * rows.shape[1]).ravel()
+    unique, inverse = np.unique(view, return_inverse=True)
+    numbers = np.bincount(inverse)
+    return unique.view(rows.dtype).reshape(-1, rows.shape[1]), numbers
@@ -1,35 +1,205 @@
 from __future__ import print_function
 """File only contains Packet class. Packet is basically a data structure for the packet transmitted
-# in the network. Very simple class."""
+# in the network. Very simple class.
+The path of a packet is kept according to a path tracking policy:
+PathTracking -- 'off', no path at all
+LastHops -- 'last', only the IDs of the last hops
+PathTree -- 'full', all paths of a broadcast in one parent-pointer tree,
+            copies of a packet share their common prefix and the
+            membership set of their path"""
+import array
+import copy
+
+
+class PathTracking(object):
+    """
+    Path tracking policy 'off': the packets carry no path
+
+    A policy turns the trace of a packet (an immutable value) and the ID of
+    the next node into the trace of the extended path; packet copies
+    just share the trace.
+    """
+    mode = 'off'
+
+    def extend(self, trace, node_id):
+        return None
+
+    def path(self, trace):
+        """List of the node IDs of the path of a trace"""
+        return []
+
+    def members(self, trace):
+        """frozenset of the node IDs of the path of a trace"""
+        return frozenset(self.path(trace))
+
+    def last(self, trace):
+        """ID of the last node of the path of a trace, None if it is empty"""
+        path = self.path(trace)
+        return path[-1] if path else None
+
+
+class LastHops(PathTracking):
+    """Path tracking policy 'last': the IDs of the last hops as a tuple"""
+    mode = 'last'
+
+    def __init__(self, hops=2):
+        self.hops = hops
+
+    def extend(self, trace, node_id):
+        return ((trace or ()) + (node_id,))[-self.hops:]
+
+    def path(self, trace):
+        return list(trace or ())
+
+
+class PathTree(PathTracking):
+    """
+    Path tracking policy 'full': the paths of a broadcast in a parent-pointer tree
+
+    The trace of a packet is the index of its last hop in the tree. Extending
+    a path adds one entry, thus a path is stored once for all the copies
+    sharing it instead of a list per copy.
+
+    The membership set of a path is built when it is asked for the first
+    time, out of the one of the nearest ancestor asked before (in the AHBP
+    the one of the previous hop), and kept for all copies with the trace.
+
+    Instance attributes:
+    parent -- index of the previous hop of every entry, -1 for the first hop
+    ids -- node ID of every entry
+    member_sets -- dict entry -> frozenset of the IDs of its path
+    """
+    mode = 'full'
+
+    def __init__(self):
+        self.parent = array.array('i')
+        self.ids = array.array('i')
+        self.member_sets = {}
+
+    def extend(self, trace, node_id):
+        self.parent.append(-1 if trace is None else trace)
+        self.ids.append(node_id)
+        return len(self.ids) - 1
+
+    def path(self, trace):
+        path = []
+        if trace is None:
+            return path
+        ids, parent = self.ids, self.parent
+        while trace >= 0:
+            path.append(ids[trace])
+            trace = parent[trace]
+        path.reverse()
+        return path
+
+    def members(self, trace):
+        if trace is None:
+            return frozenset()
+        member_sets = self.member_sets
+        members = member_sets.get(trace)
+        if members is not None:
+            return members
+        ids, parent = self.ids, self.parent
+        added = []
+        entry = trace
+        while entry >= 0 and entry not in member_sets:
+            added.append(ids[entry])
+            entry = parent[entry]
+        members = member_sets[entry].union(added) if entry >= 0 else frozenset(added)
+        member_sets[trace] = members
+        return members
+
+    def last(self, trace):
+        return None if trace is None else self.ids[trace]
+
+
+def path_tracking(mode='full', hops=2):
+    """
+    Create a path tracking policy
+
+    Arguments:
+    mode -- 'off', 'last' or 'full'
+    hops -- number of hops kept with 'last'
+    """
+    if mode == 'off':
+        return PathTracking()
+    if mode == 'last':
+        return LastHops(hops)
+    if mode == 'full':
+        return PathTree()
+    raise ValueError('unknown path tracking: {0}'.format(mode))
 
 
 class Packet(object):
     """Fancy class containing all kind of stuff which defines a data packet"""
-    def __init__(self, value, sqn, origin, data_type, node):
+    def __init__(self, value, sqn, origin, data_type, node, tracking=None):
         """Create a new Packet instance.
 
         Instance attributes:
         value -- Data value which should be transmitted in network
         seq_number -- Value showing how many packets of the same type have already been created
         origin -- Node ID of the creator node
-        path -- List containing the ID of the passed nodes
+        tracking -- path tracking policy (default = a PathTree of its own)
+        trace -- the path of the packet as stored by the policy
+        path -- List containing the ID of the passed nodes (property)
+        path_set -- frozenset with the same IDs as path for membership checks (property)
+        last_hop -- ID of the last node of the path (property)
         type -- string indicating the sensor type
         last_node -- last node of the message as Node object
+        senders -- Nodes which sent a copy of the message during the iteration,
+                   the first one is last_node; only set in the receive_buffer
         brg -- List containg all node ID's in the BRG-set; used for AHBP"""
         self.value = value  # the actual data
         self.seq_number = sqn   # this number stands for the sequence of this
                                 # packagetype with respect to the origin
         self.origin = origin + 1    # node.id of creator node
-        self.path = []
+        self.tracking = PathTree() if tracking is None else tracking
+        self.trace = None
         self.type = data_type
         self.last_node = node
+        self.senders = []
         self.brg = []
 
+    def __hash__(self):
+        """
+        Hash a packet by origin and sequence number
+
+        Packets are keys of the packet_dict of the SBA. Hashing by the memory
+        address would make its order differ from process to process.
+        Equality is still identity.
+        """
+        return hash((self.origin, self.seq_number))
+
+    def __deepcopy__(self, memo):
+        """
+        Copy the packet for the transmission to a neighbor
+
+        The BRG-set is copied, the Node objects, the tracking policy and
+        the trace are shared (the trace is immutable).
+        Copying last_node as well would copy the whole network with it.
+        """
+        new_packet = copy.copy(self)
+        new_packet.brg = list(self.brg)
+        new_packet.senders = []
+        return new_packet
+
     def add_to_path(self, node):
         """Append the node ID to the message path"""
         import NodeClass
         assert (type(node) == NodeClass.Node)
-        self.path.append(node.ID + 1)
+        self.trace = self.tracking.extend(self.trace, node.ID + 1)
+
+    def get_path(self):
+        """path getter; the IDs known to the tracking policy"""
+        return self.tracking.path(self.trace)
+
+    def get_path_set(self):
+        """path_set getter; shared by the copies with the same trace"""
+        return self.tracking.members(self.trace)
+
+    def get_last_hop(self):
+        """last_hop getter"""
+        return self.tracking.last(self.trace)
 
     def print_packet(self):
         """Print packet content in a formated way"""
@@ -51,3 +221,33 @@ class Packet(object):
             content += "BRG-Set: {0}".format(self.brg)
         content += "\n"
         return content
+
+    path = property(get_path)
+    path_set = property(get_path_set)
+    last_hop = property(get_last_hop)
+
+
+class Hello(object):
+    """Control message of the hello protocol advertising the neighbors of a node"""
+    def __init__(self, sender, seq, full, added, removed=()):
+        """Create a new Hello instance.
+
+        Instance attributes:
+        sender -- Node object sending the hello
+        seq -- number of the hellos the sender has sent before
+        full -- True if added contains the whole neighbor list of the sender
+        added -- list of Node objects which became neighbors of the sender
+        removed -- list of Node objects which are no longer neighbors"""
+        self.sender = sender
+        self.seq = seq
+        self.full = full
+        self.added = list(added)
+        self.removed = list(removed)
+
+    def return_str(self):
+        content = "hello from: {0} ".format(self.sender.ID + 1)
+        content += "seq: {0} ".format(self.seq)
+        content += "full: {0} ".format(self.full)
+        content += "added: {0} ".format([node.ID + 1 for node in self.added])
+        content += "removed: {0}\n".format([node.ID + 1 for node in self.removed])
+        return content
@@ -0,0 +1,61 @@
+"""
+This file contains the derivation of the random number generators.
+Every generator is derived from a root seed and a tuple of keys, e.g. the
+sample number and the node ID. Thus the same keys always give the same
+random numbers, no matter in which order or in which process samples are run.
+"""
+import hashlib
+import random
+import numpy as np
+
+
+def derive_seed(*keys):
+    """
+    Derive a 32-bit seed from a tuple of keys
+
+    Uses a hash function instead of hash(), so the seed is
+    the same in every process and every python version.
+
+    Arguments:
+    keys -- integers or strings, usually root seed, sample, node ID
+
+    Return-type:
+    seed -- integer in [0, 2**32)
+    """
+    text = '|'.join(str(key) for key in keys)
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16)
+
+
+def stream(*keys):
+    """Return a random.Random instance seeded with derive_seed(*keys)"""
+    return random.Random(derive_seed(*keys))
+
+
+def numpy_stream(*keys):
+    """Return a numpy RandomState seeded with derive_seed(*keys)"""
+    return np.random.RandomState(derive_seed(*keys))
+
+
+def graph_stream(root_seed, sample):
+    """Random generator for the graph generation of a sample"""
+    return stream(root_seed, sample, 'graph')
+
+
+def seed_nodes(graph, root_seed, sample):
+    """
+    Give every node of the graph its own random generator
+
+    The generator only depends on the root seed, the sample and the node ID.
+    Call it before every run of a protocol which draws random numbers.
+
+    Arguments:
+    graph -- networkx.Graph with Node instances
+    root_seed -- root seed of the sweep
+    sample -- key of the sample, e.g. the sample number
+
+    Return-type:
+    None
+    """
+    for node in graph.nodes():
+        node.rng = stream(root_seed, sample, 'node', node.ID)
@@ -0,0 +1,217 @@
+"""
+This file contains the result files of the simulation sweeps.
+Every record (one protocol run on one sample graph) is appended to disk
+as soon as it is computed, so a crashed or interrupted sweep loses
+nothing and can be resumed.
+The files are columnar: a result directory contains chunk directories
+(chunk_00000, chunk_00001, ...), each with one raw binary file per column
+to which the values are appended. The layout is described in meta.json.
+Once a chunk holds chunk_rows records or more, a new one is started.
+Only seeded sweeps are resumed. Every unseeded sweep draws new graphs and
+gets its own negative id in the seed column (see new_sweep_id), so its
+records are neither merged with nor replaced by the ones of other sweeps.
+"""
+import json
+import os
+import numpy as np
+
+# column name and numpy dtype of the records
+COLUMNS = (('size', '<i4'),
+           ('sample', '<i4'),
+           ('seed', '<i8'),
+           ('protocol', '<i1'),
+           ('conn', '<f8'),
+           ('messages', '<i8'),
+           ('rebroadcaster', '<i4'),
+           ('max_load', '<i8'),
+           ('hellos', '<i8'))
+# the protocol is stored as a small integer
+PROTOCOL_CODES = {'flooding': 0, 'AHBP': 1, 'SBA': 2, 'half_sba': 3}
+PROTOCOL_NAMES = dict((code, name) for name, code in PROTOCOL_CODES.items())
+# stands for seed=None, i.e. the unseeded global random module; the root
+# seeds are >= 0, the unseeded sweeps get NO_SEED, NO_SEED - 1, ...
+NO_SEED = -1
+
+
+def chunk_dirs(root):
+    """Sorted list of the chunk directories in the result directory root"""
+    if not os.path.isdir(root):
+        return []
+    names = sorted(name for name in os.listdir(root) if name.startswith('chunk_'))
+    return [os.path.join(root, name) for name in names]
+
+
+def chunk_rows_on_disk(chunk):
+    """
+    Number of complete records in a chunk
+
+    If the process died during an append, some columns are one record longer;
+    only the records present in all the columns count. A column without a
+    file was added after the chunk was written, it reads as zeros.
+    """
+    rows = []
+    for name, dtype in COLUMNS:
+        path = os.path.join(chunk, name + '.bin')
+        if os.path.exists(path):
+            rows.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+    return min(rows) if rows else 0
+
+
+class ResultSink(object):
+    """
+    Append-only writer of the result records
+
+    Use it as a context manager, the column files are closed at the end.
+
+    Instance attributes:
+    root -- result directory
+    chunk_rows -- number of records per chunk
+    """
+    def __init__(self, root, chunk_rows=100000):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.files = {}
+        self.rows = 0
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        meta = {'columns': COLUMNS, 'protocols': PROTOCOL_CODES, 'no_seed': NO_SEED}
+        with open(os.path.join(root, 'meta.json'), 'w') as outfile:
+            json.dump(meta, outfile, indent=1, sort_keys=True)
+        chunks = chunk_dirs(root)
+        if chunks:
+            self.open_chunk(chunks[-1])
+        else:
+            self.open_chunk(os.path.join(root, 'chunk_00000'))
+
+    def open_chunk(self, chunk):
+        """Open the column files of a chunk; a torn last record is cut off"""
+        self.close()
+        if not os.path.isdir(chunk):
+            os.makedirs(chunk)
+        self.chunk = chunk
+        self.rows = chunk_rows_on_disk(chunk)
+        for name, dtype in COLUMNS:
+            path = os.path.join(chunk, name + '.bin')
+            outfile = open(path, 'ab')
+            # cuts a torn record, pads a column added later with zeros
+            outfile.truncate(self.rows * np.dtype(dtype).itemsize)
+            self.files[name] = outfile
+
+    def next_chunk(self):
+        number = int(os.path.basename(self.chunk)[len('chunk_'):]) + 1
+        self.open_chunk(os.path.join(self.root, 'chunk_{0:05d}'.format(number)))
+
+    def append(self, records):
+        """
+        Append records and flush them to disk
+
+        Arguments:
+        records -- list of dicts with a value for every column;
+                   protocol as name, seed None is allowed
+        """
+        if self.rows >= self.chunk_rows:
+            self.next_chunk()
+        for name, dtype in COLUMNS:
+            values = []
+            for record in records:
+                value = record[name]
+                if name == 'protocol':
+                    value = PROTOCOL_CODES[value]
+                elif name == 'seed' and value is None:
+                    value = NO_SEED
+                values.append(value)
+            np.array(values, dtype=dtype).tofile(self.files[name])
+        for outfile in self.files.values():
+            outfile.flush()
+        self.rows += len(records)
+
+    def close(self):
+        for outfile in self.files.values():
+            outfile.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_results(root):
+    """
+    Read all records of a result directory
+
+    A record written twice for the same (size, sample, seed, protocol),
+    e.g. because a sweep was interrupted in the middle of a sample and
+    resumed, only counts once (the last one).
+
+    Return-type:
+    columns -- dict column name -> numpy array
+    """
+    parts = dict((name, []) for name, dtype in COLUMNS)
+    for chunk in chunk_dirs(root):
+        rows = chunk_rows_on_disk(chunk)
+        for name, dtype in COLUMNS:
+            path = os.path.join(chunk, name + '.bin')
+            if os.path.exists(path):
+                parts[name].append(np.fromfile(path, dtype=dtype, count=rows))
+            else:
+                parts[name].append(np.zeros(rows, dtype=dtype))
+    columns = {}
+    for name, dtype in COLUMNS:
+        columns[name] = np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype)
+    if len(columns['size']):
+        keys = np.column_stack((columns['size'], columns['sample'],
+                                columns['seed'], columns['protocol']))
+        # unique on the reversed rows -> keep the last occurrence
+        rev = np.ascontiguousarray(keys[::-1])
+        unique, index = np.unique(rev.view([('', rev.dtype)] * 4), return_index=True)
+        keep = np.sort(len(keys) - 1 - index)
+        columns = dict((name, values[keep]) for name, values in columns.items())
+    return columns
+
+
+def new_sweep_id(root):
+    """Value of the seed column for a new unseeded sweep, below all the ones in root"""
+    seeds = read_results(root)['seed']
+    return min(int(seeds.min()) if len(seeds) else 0, 0) - 1
+
+
+def last_sweep_id(columns):
+    """Seed column value of the latest unseeded sweep in the columns"""
+    seeds = columns['seed']
+    return min(int(seeds.min()) if len(seeds) else NO_SEED, NO_SEED)
+
+
+def completed_samples(root, seed, protocols):
+    """
+    Samples for which all protocols have a record
+
+    Arguments:
+    root -- result directory
+    seed -- root seed of the sweep (None -> unseeded, which is never resumed)
+    protocols -- names of the protocols of a sample
+
+    Return-type:
+    done -- set of (size, sample)
+    """
+    if seed is None:
+        return set()
+    columns = read_results(root)
+    counts = {}
+    for size, sample, row_seed in zip(columns['size'], columns['sample'], columns['seed']):
+        if row_seed == seed:
+            key = (int(size), int(sample))
+            counts[key] = counts.get(key, 0) + 1
+    return set(key for key, count in counts.items() if count >= len(protocols))
+
+
+def select(columns, **conditions):
+    """Rows of the columns where every column named in conditions has the given value"""
+    mask = np.ones(len(columns['size']), dtype=bool)
+    for name, value in conditions.items():
+        if name == 'protocol':
+            value = PROTOCOL_CODES[value]
+        mask &= columns[name] == value
+    return dict((name, values[mask]) for name, values in columns.items())
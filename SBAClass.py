@@ -4,7 +4,6 @@ This file contains all functions related to the Scalable Broadcast Algorithm.
 Note that since it does not inherit from the Node Class, the considered node
 is always passed as an argument -> calling_node
 """
-import random
 import math
 import Package
 
@@ -39,6 +38,7 @@ def update_packet_dict(calling_node, iteration):
             # if expired delete it from the packet_dict
             packets_to_del.append(packet)
             # check for each node the calculated cover_set
+            bool_cs = True
             for node in calling_node.two_hop_dict:
                 bool_cs = node in calling_node.cover_dict[packet_identifier]
                 if not bool_cs:
@@ -104,8 +104,7 @@ def check_receive_buffer(calling_node, iteration, timer):
         if bool_pd is True and bool_ds is True:
             update_cover_set(calling_node, message)
         elif bool_pd is False and bool_ds is False:
-            message.add_to_path(calling_node)
-            calling_node.data_stack.append(message)
+            calling_node.learn(message)
             # check for this unknown message if the neighbors of the current node
             # are already covered by the last node
             bool_neigh = check_neigh(calling_node, message.last_node)
@@ -115,9 +114,9 @@ def check_receive_buffer(calling_node, iteration, timer):
                 t = get_random_timer(calling_node, timer)
                 calling_node.packet_dict[message] = (t, iteration)
                 identifier = (message.origin, message.seq_number)
-                calling_node.cover_dict[identifier] = [message.last_node]
-                for neigh in message.last_node.two_hop_dict:
-                    calling_node.cover_dict[identifier].append(neigh)
+                calling_node.cover_dict[identifier] = set()
+                # covers the first sender and the copies of the other senders
+                update_cover_set(calling_node, message)
     # after having processed all messages in the receive_buffer clear it
     calling_node.del_receive_buffer()
 
@@ -132,6 +131,8 @@ def check_neigh(calling_node, neigh):
     Return-type50
     Boolean
     """
+    # a node without neighbors has nothing to cover, e.g. after a link failure
+    bool_value = True
     for node in calling_node.two_hop_dict:
         bool_value = (node in neigh.two_hop_dict or node == neigh)
         # if one node is not contained immediately leave for-loop,
@@ -148,6 +149,7 @@ def get_random_timer(calling_node, timer_para):
     Return an iteration_timestep from a uniform distribution defined by random_timer.
     -> random_timer is a design-parameter
     Graph only used to get the nodes degree, no topology information used
+    The number is drawn from the random generator of the calling_node.
 
     Arguments:
     calling_node -- currently treated node
@@ -171,7 +173,7 @@ def get_random_timer(calling_node, timer_para):
     # this is a tuning-parameter, which is still open
     random_timer = timer_para
     # t=0
-    t = random.randint(0, math.ceil(T_0 * random_timer))
+    t = calling_node.rng.randint(0, int(math.ceil(T_0 * random_timer)))
     return t
 
 
@@ -184,7 +186,8 @@ def update_cover_set(calling_node, message):
     as unique identifier for the message.
     Cannot take the message as key, since when a message is send to a neighbor
     a copy of it will be saved. -> it is another object.
-    If necessary add the message sender and its neighbors to the cover_dict values
+    Add the senders of all the merged copies and their neighbors
+    to the cover_dict values.
 
     Arguments:
     calling_node -- currently treated node
@@ -192,10 +195,7 @@ def update_cover_set(calling_node, message):
     graph/two_hop_dict -- contains topology information
     """
     identifier = (message.origin, message.seq_number)
-    message_node = message.last_node
-
-    if message_node not in calling_node.cover_dict[identifier]:
-        calling_node.cover_dict[identifier].append(message_node)
-    for neigh in message_node.two_hop_dict:
-        if neigh not in calling_node.cover_dict[identifier]:
-            calling_node.cover_dict[identifier].append(neigh)
+    cover_set = calling_node.cover_dict[identifier]
+    for message_node in message.senders:
+        cover_set.add(message_node)
+        cover_set.update(message_node.two_hop_dict)
@@ -0,0 +1,155 @@
+from __future__ import division
+from __future__ import print_function
+"""
+This file contains a generator of random graphs with an algebraic
+connectivity inside a target band.
+The graphs are built like Main.build_rand_graph (delete nodes of a hexagonal
+lattice until enough are left), but the deleted nodes are chosen by their
+lattice distance to a shell of some radius around a random center:
+with a positive weight beta the nodes far off the shell go first.
+Radius 0 leaves compact graphs (beta > 0) or stringy ones (beta < 0),
+radius 1 rings around a hole and so on; beta = 0 is the uniform deletion
+of build_rand_graph.
+The (beta, radius) of a candidate is picked by UCB1 on the acceptance rate
+of each pair so far (a bandit), thus the generator ends up with the pair
+filling the band best and falls back to uniform deletion if none is better.
+"""
+import math
+import random
+import numpy as np
+import networkx as nx
+import Main as mn
+
+
+def lattice_distance(node, center):
+    """Number of hops between two nodes of Main.lattice_graph"""
+    dx = node[0] - center[0]
+    dy = node[1] - center[1]
+    return (abs(dx) + abs(dy) + abs(dx + dy)) // 2
+
+
+def connectivity(graph):
+    """Exact algebraic connectivity and the laplacian of a networkx graph"""
+    laplacian = nx.laplacian_matrix(graph).getA()
+    return np.linalg.eigvalsh(laplacian)[1], laplacian
+
+
+class ConnectivityGenerator(object):
+    """
+    Random graphs with num_nodes nodes and a connectivity in band
+
+    Arguments:
+    num_nodes -- number of nodes of the graphs
+    band -- (lower, upper) limits of the algebraic connectivity
+    rng -- random generator (default = random module)
+    length -- side of the initial lattice (default = num_nodes like build_rand_graph)
+    betas -- number of beta values in the grid from -beta_max to beta_max
+    beta_max -- limit of abs(beta)
+    radii -- number of shell radii 0, 1, ... (default = ceil(sqrt(num_nodes)))
+
+    Instance attributes:
+    candidates -- number of generated graphs
+    accepted -- number of graphs inside the band
+    arms -- grid of the (beta, radius) pairs
+    trials, hits -- per pair: candidates and accepted graphs
+    """
+    def __init__(self, num_nodes, band, rng=random, length=None, betas=9,
+                 beta_max=8., radii=None):
+        self.num_nodes = num_nodes
+        self.lower, self.upper = band
+        self.rng = rng
+        if length is None:
+            length = num_nodes
+        self.length = length
+        if radii is None:
+            radii = int(math.ceil(math.sqrt(num_nodes)))
+        self.arms = [(beta, radius) for radius in range(radii)
+                     for beta in np.linspace(-beta_max, beta_max, betas)]
+        self.trials = [0] * len(self.arms)
+        self.hits = [0] * len(self.arms)
+        self.arm = self.arms.index((0., 0))
+        self.beta, self.radius = self.arms[self.arm]
+        self.candidates = 0
+        self.accepted = 0
+
+    def acceptance_rate(self):
+        """Accepted graphs per generated graph"""
+        return self.accepted / self.candidates if self.candidates else 0.
+
+    def weighted_choice(self, nodes, center):
+        """Choose a node with a probability growing with exp(beta * distance to the shell)"""
+        dist = np.array([abs(lattice_distance(node, center) - self.radius) for node in nodes])
+        weights = np.exp(self.beta * (dist - dist.max()))
+        threshold = self.rng.random() * weights.sum()
+        index = int(np.searchsorted(np.cumsum(weights), threshold, side='right'))
+        return nodes[min(index, len(nodes) - 1)]
+
+    def steered_graph(self):
+        """
+        Delete lattice nodes steered by beta and radius until num_nodes remain
+
+        Like build_rand_nx_graph: a deletion cutting the graph is undone,
+        unless a component is still big enough, which is then kept.
+        """
+        graph = mn.lattice_graph(self.length)
+        center = graph.nodes()[self.rng.randint(0, len(graph) - 1)]
+        while len(graph) > self.num_nodes:
+            removed_node = self.weighted_choice(graph.nodes(), center)
+            removed_edges = graph.edges(removed_node)
+            graph.remove_node(removed_node)
+            if not nx.is_connected(graph):
+                for sub in nx.connected_component_subgraphs(graph):
+                    if len(sub) >= self.num_nodes:
+                        graph = sub
+                        break
+                else:
+                    graph.add_node(removed_node)
+                    graph.add_edges_from(removed_edges)
+        return graph
+
+    def choose_arm(self):
+        """Pick the (beta, radius) of the next candidate by UCB1"""
+        untried = [arm for arm in range(len(self.arms)) if not self.trials[arm]]
+        if untried:
+            arm = untried[self.rng.randint(0, len(untried) - 1)]
+        else:
+            total = sum(self.trials)
+            score = [h / n + math.sqrt(2 * math.log(total) / n)
+                     for h, n in zip(self.hits, self.trials)]
+            arm = score.index(max(score))
+        self.arm = arm
+        self.beta, self.radius = self.arms[arm]
+
+    def update(self, hit):
+        """Book the outcome of the candidate"""
+        self.trials[self.arm] += 1
+        if hit:
+            self.hits[self.arm] += 1
+
+    def sample(self, max_candidates=2000):
+        """
+        Generate graphs until one is inside the band
+
+        Return-type:
+        laplacian -- numpy array; laplacian of the graph
+        conn -- its algebraic connectivity
+        """
+        for i in range(max_candidates):
+            self.choose_arm()
+            graph = self.steered_graph()
+            self.candidates += 1
+            conn, laplacian = connectivity(graph)
+            hit = self.lower <= conn <= self.upper
+            self.update(hit)
+            if hit:
+                self.accepted += 1
+                return laplacian, conn
+        raise RuntimeError('no graph with connectivity in [{0}, {1}] after {2} candidates'.format(
+            self.lower, self.upper, max_candidates))
+
+    def report(self):
+        """Print the acceptance rate and the best (beta, radius) so far"""
+        rate = [h / n if n else 0. for h, n in zip(self.hits, self.trials)]
+        beta, radius = self.arms[rate.index(max(rate))]
+        print('candidates: {0} accepted: {1} rate: {2:.3f} best beta: {3:.2f} radius: {4}'.format(
+            self.candidates, self.accepted, self.acceptance_rate(), beta, radius))
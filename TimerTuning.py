@@ -0,0 +1,163 @@
+from __future__ import division
+from __future__ import print_function
+"""
+This file contains the tuning of the design parameter of the SBA random timer.
+Candidate values are evaluated with the vectorized SBA over a set of topologies.
+The evaluation runs in stages (successive halving): after each stage only the
+promising candidates are kept and get more seeds in the next one.
+In the end the Pareto front of messages sent against rounds to completion is reported.
+"""
+import multiprocessing
+import numpy as np
+import Main as mn
+import FastBroadcast as fast
+import RandomStreams as rs
+
+
+def evaluate_candidate(task):
+    """
+    Run the multi-seed SBA for one timer value on one topology
+
+    Top-level function, such that it can be sent to the worker processes.
+
+    Arguments:
+    task -- tuple (timer, laplacian, seeds, rounds)
+
+    Return-type:
+    messages -- numpy array with the total messages per seed
+    completion -- numpy array with the rounds to completion per seed;
+                  runs which never completed count with rounds
+    """
+    timer, laplacian, seeds, rounds = task
+    graph = mn.setup_graph(laplacian)
+    topology = fast.Topology(graph)
+    messages, max_load, rebroad, completion = fast.run_sba_seeds(topology, timer, seeds, rounds)
+    completion = np.where(completion < 0, rounds, completion)
+    return messages, completion
+
+
+def pareto_front(points):
+    """
+    Return the indices of the non-dominated points, both coordinates minimized
+
+    Arguments:
+    points -- list of (x, y) tuples
+
+    Return-type:
+    front -- list of indices sorted by x
+    """
+    front = []
+    for i, (x_i, y_i) in enumerate(points):
+        dominated = False
+        for j, (x_j, y_j) in enumerate(points):
+            if j != i and x_j <= x_i and y_j <= y_i and (x_j < x_i or y_j < y_i):
+                dominated = True
+                break
+        if not dominated:
+            front.append(i)
+    front.sort(key=lambda i: points[i])
+    return front
+
+
+def select_candidates(points, keep):
+    """
+    Keep the candidates of the first Pareto ranks
+
+    Peel off Pareto fronts until at least keep candidates are selected.
+
+    Arguments:
+    points -- list of (messages, rounds) tuples
+    keep -- minimal number of candidates to keep
+
+    Return-type:
+    selected -- list of indices into points
+    """
+    remaining = list(range(len(points)))
+    selected = []
+    while remaining and len(selected) < keep:
+        front = pareto_front([points[i] for i in remaining])
+        front = [remaining[i] for i in front]
+        selected.extend(front)
+        remaining = [i for i in remaining if i not in front]
+    return selected
+
+
+def tune_timer(laplacians, timer_values=(0.5, 1, 2, 3, 5, 8, 13), seeds=8,
+               stages=3, eta=2, rounds=100, processes=None, root_seed=0):
+    """
+    Search the timer parameter of the SBA over a set of topologies
+
+    In every stage all surviving candidates run 'seeds' more timer
+    realizations on every topology (the same seeds for all candidates).
+    Afterwards only the best 1/eta of the candidates by Pareto rank stay,
+    while the number of new seeds is multiplied by eta.
+    The seeds are derived from root_seed and the run number, thus the
+    result does not depend on the number of processes.
+
+    Arguments:
+    laplacians -- list of laplacian matrices of the topologies
+    timer_values -- candidate values for the timer parameter
+    seeds -- number of seeds per topology in the first stage
+    stages -- number of halving stages
+    eta -- reduction factor of the candidates per stage
+    rounds -- number of iterations of the SBA
+    processes -- size of the process pool (default = number of cpus)
+    root_seed -- root seed of the random timers
+
+    Return-type:
+    results -- dict with timer as key and [mean messages, mean rounds, number of runs]
+    front -- list of timer values on the Pareto front of the last stage
+    """
+    timer_values = list(timer_values)
+    sums = dict((timer, [0., 0., 0]) for timer in timer_values)
+    candidates = list(timer_values)
+    next_seed = 0
+    pool = multiprocessing.Pool(processes)
+    try:
+        for stage in range(stages):
+            stage_seeds = [rs.derive_seed(root_seed, 'timer', i)
+                           for i in range(next_seed, next_seed + seeds)]
+            next_seed += seeds
+            tasks = [(timer, laplacian, stage_seeds, rounds)
+                     for timer in candidates for laplacian in laplacians]
+            outcome = pool.map(evaluate_candidate, tasks)
+            for (timer, laplacian, s, r), (messages, completion) in zip(tasks, outcome):
+                sums[timer][0] += messages.sum()
+                sums[timer][1] += completion.sum()
+                sums[timer][2] += len(messages)
+            points = [(sums[timer][0] / sums[timer][2], sums[timer][1] / sums[timer][2])
+                      for timer in candidates]
+            print('stage', stage, dict(zip(candidates, points)))
+            if stage < stages - 1:
+                keep = max(1, int(np.ceil(len(candidates) / eta)))
+                candidates = [candidates[i] for i in sorted(select_candidates(points, keep))]
+                seeds *= eta
+    finally:
+        pool.close()
+        pool.join()
+
+    results = dict((timer, [total[0] / total[2], total[1] / total[2], total[2]])
+                   for timer, total in sums.items() if total[2])
+    points = [tuple(results[timer][:2]) for timer in candidates]
+    front = [candidates[i] for i in pareto_front(points)]
+    return results, front
+
+
+def print_front(results, front):
+    """Print the Pareto front of the tuning in a formated way"""
+    print('timer  messages  rounds  runs')
+    for timer in front:
+        mes, rounds, runs = results[timer]
+        print('{0:5}  {1:8.1f}  {2:6.2f}  {3:4}'.format(timer, mes, rounds, runs))
+
+
+def main(size=10, num_graphs=10, root_seed=0):
+    """Tune the timer on random graphs of the given size"""
+    laplacians = [mn.build_rand_graph(size, rs.graph_stream(root_seed, i))
+                  for i in range(num_graphs)]
+    results, front = tune_timer(laplacians, root_seed=root_seed)
+    print_front(results, front)
+
+
+if __name__ == '__main__':
+    main()